@@ -47,6 +47,7 @@ import shutil
 import inspect
 import textwrap
 import importlib
+import threading
 from pathlib import Path
 from string import Template
 from typing import Any, Dict, List, Tuple
@@ -94,6 +95,13 @@ DOCUMENTATION = {
 # maximum items to show in help for combo list items
 JOV_LIST_MAX = 25
 
+# seconds between two throttled messages for the same node and route
+JOV_MESSAGE_RATE = 0.1
+try:
+    JOV_MESSAGE_RATE = max(0, float(os.getenv("JOV_MESSAGE_RATE", JOV_MESSAGE_RATE)))
+except Exception as e:
+    logger.error(str(e))
+
 # HTML TEMPLATES
 TEMPLATE = {}
 
@@ -374,12 +382,19 @@ class Lexicon(metaclass=LexiconMeta):
 
 class Singleton(type):
     _instances = {}
+    # one lock per class, so a constructor may build other singletons
+    _locks = {}
+    _lock = threading.Lock()
 
     def __call__(cls, *arg, **kw) -> Any:
         # If the instance does not exist, create and store it
         if cls not in cls._instances:
-            instance = super().__call__(*arg, **kw)
-            cls._instances[cls] = instance
+            with Singleton._lock:
+                lock = Singleton._locks.setdefault(cls, threading.RLock())
+            with lock:
+                # another thread may have won the race
+                if cls not in cls._instances:
+                    cls._instances[cls] = super().__call__(*arg, **kw)
         return cls._instances[cls]
 
 # =============================================================================
@@ -706,8 +721,87 @@ class ComfyAPIMessage:
         dat = cls.MESSAGE.pop(sid)
         return dat
 
-def comfy_message(ident:str, route:str, data:dict) -> None:
+class ComfyMessageThrottle(metaclass=Singleton):
+    """Coalesce high-frequency messages per (node, route).
+
+    The first message for a key goes out at once. Anything sent for that key
+    within JOV_MESSAGE_RATE seconds only replaces the pending payload, and a
+    background flusher sends the latest one when the window closes. flush()
+    sends pending payloads right away, e.g. at the end of a batch.
+    """
+    def __init__(self, rate:float=None) -> None:
+        self.__rate = JOV_MESSAGE_RATE if rate is None else rate
+        self.__lock = threading.Lock()
+        self.__last: Dict[Tuple[str, str], float] = {}
+        self.__pending: Dict[Tuple[str, str], dict] = {}
+        self.__flusher: threading.Thread = None
+        self.__stats = {'sent': 0, 'coalesced': 0}
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+    @rate.setter
+    def rate(self, rate:float) -> None:
+        self.__rate = max(0, rate)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """sent: messages that went out; coalesced: messages saved."""
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __send(self, route:str, data:dict) -> None:
+        self.__stats['sent'] += 1
+        PromptServer.instance.send_sync(route, data)
+
+    def __run(self) -> None:
+        while True:
+            time.sleep(self.__rate)
+            now = time.monotonic()
+            with self.__lock:
+                for key in [k for k in self.__pending if now - self.__last.get(k, 0) >= self.__rate]:
+                    self.__last[key] = now
+                    self.__send(key[1], self.__pending.pop(key))
+                if len(self.__pending) == 0:
+                    self.__flusher = None
+                    return
+
+    def send(self, ident:str, route:str, data:dict) -> None:
+        key = (str(ident), route)
+        now = time.monotonic()
+        with self.__lock:
+            if key not in self.__pending and now - self.__last.get(key, 0) >= self.__rate:
+                self.__last[key] = now
+                self.__send(route, data)
+                return
+
+            if key in self.__pending:
+                self.__stats['coalesced'] += 1
+            self.__pending[key] = data
+            if self.__flusher is None:
+                self.__flusher = threading.Thread(target=self.__run, name="jovi-message", daemon=True)
+                self.__flusher.start()
+
+    def flush(self, ident:str=None, route:str=None) -> None:
+        """Send the pending payloads for a node and/or route (default: all)."""
+        now = time.monotonic()
+        with self.__lock:
+            for key in list(self.__pending.keys()):
+                if (ident is None or key[0] == str(ident)) and (route is None or key[1] == route):
+                    self.__last[key] = now
+                    self.__send(key[1], self.__pending.pop(key))
+
+def comfy_message(ident:str, route:str, data:dict, throttle:bool=False) -> None:
+    """Send a message to the frontend.
+
+    throttle coalesces it with other messages for the same node and route,
+    see ComfyMessageThrottle.
+    """
     data['id'] = ident
+    if throttle:
+        ComfyMessageThrottle().send(ident, route, data)
+        return
     PromptServer.instance.send_sync(route, data)
 
 try:
@@ -25,6 +25,7 @@ from Jovimetrix.sup.image import  \
     image_crop, image_crop_center, image_crop_polygonal, image_equalize, \
     image_gamma, image_grayscale, image_hsv, image_levels, image_convert, \
     image_mask, image_mask_add, image_matte, image_pixelate, image_posterize, \
+    image_rank_filter, \
     image_sharpen, image_threshold, image_transform, image_edge_wrap, \
     image_split, morph_edge_detect, morph_emboss, pixel_eval, tensor2cv, \
     color_theory, remap_fisheye, remap_perspective, remap_polar, cv2tensor, \
@@ -105,6 +106,8 @@ Enhance and modify images with various effects such as blurring, sharpening, col
         params = list(zip_longest_fill(pA, mask, op, radius, val, lohi,
                                                     lmh, hsv, contrast, gamma, matte, invert))
         images = []
+        # quantize palettes warm-start from frame to frame within this batch only
+        stream = object()
         pbar = ProgressBar(len(params))
         for idx, (pA, mask, op, radius, val, lohi, lmh, hsv, contrast, gamma, matte, invert) in enumerate(params):
             pA = tensor2cv(pA) if pA is not None else channel_solid(chan=EnumImageType.BGRA)
@@ -152,7 +155,13 @@ Enhance and modify images with various effects such as blurring, sharpening, col
                     r = min(radius, 357)
                     if r % 2 == 0:
                         r += 1
-                    img_new = cv2.medianBlur(pA, r)
+                    img_new = image_rank_filter(pA, r, 0.5)
+
+                case EnumAdjustOP.RANK_FILTER:
+                    r = min(radius, 357)
+                    if r % 2 == 0:
+                        r += 1
+                    img_new = image_rank_filter(pA, r, min(val, 1))
 
                 case EnumAdjustOP.SHARPEN:
                     r = min(radius, 511)
@@ -170,7 +179,7 @@ Enhance and modify images with various effects such as blurring, sharpening, col
                     img_new = image_pixelate(pA, val / 255.)
 
                 case EnumAdjustOP.QUANTIZE:
-                    img_new = image_quantize(pA, int(val))
+                    img_new = image_quantize(pA, int(val), stream=stream)
 
                 case EnumAdjustOP.POSTERIZE:
                     img_new = image_posterize(pA, int(val))
@@ -545,6 +554,7 @@ Create masks based on specific color ranges within an image. Specify the color r
                 Lexicon.BOOLEAN: ("BOOLEAN", {"default": False, "tooltip": "use an end point (start->end) when calculating the filter range"}),
                 Lexicon.END: ("VEC3INT", {"default": (128, 128, 128), "rgb": True}),
                 Lexicon.FLOAT: ("VEC3", {"default": (0.5,0.5,0.5), "min":0, "max":1, "tooltip": "the fuzziness use to extend the start and end range(s)"}),
+                Lexicon.HSV: ("BOOLEAN", {"default": False, "tooltip": "compare hue, saturation and value instead of the color channels"}),
                 Lexicon.MATTE: ("VEC4INT", {"default": (0, 0, 0, 255), "rgb": True}),
             }
         })
@@ -556,14 +566,31 @@ Create masks based on specific color ranges within an image. Specify the color r
         use_range = parse_param(kw, Lexicon.BOOLEAN, EnumConvertType.VEC3, [(0,0,0)], 0, 255)
         end = parse_param(kw, Lexicon.END, EnumConvertType.VEC3INT, [(128,128,128)], 0, 255)
         fuzz = parse_param(kw, Lexicon.FLOAT, EnumConvertType.VEC3, [(0.5,0.5,0.5)], 0, 1)
+        hsv = parse_param(kw, Lexicon.HSV, EnumConvertType.BOOLEAN, False)
         matte = parse_param(kw, Lexicon.MATTE, EnumConvertType.VEC4INT, [(0, 0, 0, 255)], 0, 255)
-        params = list(zip_longest_fill(pA, start, use_range, end, fuzz, matte))
-        images = []
-        pbar = ProgressBar(len(params))
-        for idx, (pA, start, use_range, end, fuzz, matte) in enumerate(params):
+        params = list(zip_longest_fill(pA, start, use_range, end, fuzz, hsv, matte))
+
+        # frames of one size that share a filter go through image_filter
+        # together, so its range is set up once for the whole group
+        frames = []
+        groups = {}
+        for idx, (pA, start, use_range, end, fuzz, hsv, _) in enumerate(params):
             img = np.zeros((MIN_IMAGE_SIZE, MIN_IMAGE_SIZE, 3), dtype=np.uint8) if pA is None else tensor2cv(pA)
+            if img.ndim == 2 or img.shape[2] == 1:
+                img = image_convert(img, 3)
+            frames.append(img)
+            key = (img.shape, tuple(start), bool(use_range), tuple(end), tuple(fuzz), bool(hsv))
+            groups.setdefault(key, []).append(idx)
+
+        masks = [None] * len(frames)
+        for (_, start, use_range, end, fuzz, hsv), group in groups.items():
+            batch, mask = image_filter(np.stack([frames[i] for i in group]), start, end, fuzz, use_range, hsv)
+            for i, img, m in zip(group, batch, mask):
+                frames[i], masks[i] = img, m
 
-            img, mask = image_filter(img, start, end, fuzz, use_range)
+        images = []
+        pbar = ProgressBar(len(params))
+        for idx, (img, mask, (*_, matte)) in enumerate(zip(frames, masks, params)):
             if img.shape[2] == 3:
                 alpha_channel = np.zeros((img.shape[0], img.shape[1], 1), dtype=img.dtype)
                 img = np.concatenate((img, alpha_channel), axis=2)
@@ -4,9 +4,14 @@ Creation
 """
 
 import os
+import re
 import sys
+import json
+import time
+import hashlib
+import threading
 from pathlib import Path
-from typing import Any, Tuple
+from typing import Any, Dict, Tuple
 
 import torch
 from loguru import logger
@@ -18,10 +23,10 @@ except:
     pass
 from comfy.utils import ProgressBar
 
-from Jovimetrix import JOVImageNode, Lexicon, comfy_message, ROOT
+from Jovimetrix import JOVImageNode, Lexicon, ComfyMessageThrottle, comfy_message, ROOT
 from Jovimetrix.sup.util import load_file, parse_param, EnumConvertType, parse_value
 from Jovimetrix.sup.image import EnumInterpolation, EnumScaleMode, cv2tensor_full, image_convert, image_scalefit, tensor2cv, MIN_IMAGE_SIZE
-from Jovimetrix.sup.shader import PTYPE, shader_meta, CompileException, GLSLShader
+from Jovimetrix.sup.shader import PTYPE, shader_meta, shader_passes, CompileException, GLSLShader
 
 # =============================================================================
 
@@ -46,6 +51,23 @@ logger.info(f"fragment programs: {len(GLSL_PROGRAMS['fragment'])}")
 
 JOV_CATEGORY = "CREATE"
 
+# output depends on the clock, or on frames rendered before it
+RE_ANIMATED = re.compile(r"\b(iTime|iFrame)\b")
+RE_FEEDBACK = re.compile(r"\biPrevFrame\b")
+
+# tensors larger than this are hashed from a strided sample plus their sum
+HASH_SAMPLE = 1 << 20
+
+# parsed shader metadata, kept between runs
+JOV_GLSL_CACHE = Path(os.getenv("JOV_GLSL_CACHE", str(ROOT / '.cache' / 'glsl_meta.json')))
+
+# seconds between scans of the shader folders for new or edited files; 0 = off
+JOV_GLSL_WATCH = 0.
+try:
+    JOV_GLSL_WATCH = max(0, float(os.getenv("JOV_GLSL_WATCH", JOV_GLSL_WATCH)))
+except Exception as e:
+    logger.error(str(e))
+
 # =============================================================================
 
 try:
@@ -81,6 +103,28 @@ try:
 except Exception as e:
     logger.error(e)
 
+def glsl_digest(digest:Any, value:Any) -> None:
+    """Feed a node input into a hashlib digest, stable across runs."""
+    if isinstance(value, torch.Tensor):
+        value = value.detach()
+        digest.update(f"{tuple(value.shape)}{value.dtype}".encode())
+        flat = value.reshape(-1)
+        if flat.numel() > HASH_SAMPLE:
+            digest.update(str(flat.double().sum().item()).encode())
+            flat = flat[::flat.numel() // HASH_SAMPLE + 1]
+        digest.update(flat.contiguous().cpu().numpy().tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'[')
+        for v in value:
+            glsl_digest(digest, v)
+        digest.update(b']')
+    elif isinstance(value, dict):
+        for k in sorted(value.keys(), key=str):
+            digest.update(str(k).encode())
+            glsl_digest(digest, value[k])
+    else:
+        digest.update(repr(value).encode())
+
 class GLSLNodeBase(JOVImageNode):
     CATEGORY = f"JOVIMETRIX 🔺🟩🔵/GLSL"
     VERTEX = GLSLShader.PROG_VERTEX
@@ -100,13 +144,39 @@ class GLSLNodeBase(JOVImageNode):
         return Lexicon._parse(d, cls)
 
     @classmethod
-    def IS_CHANGED(cls, **kw) -> float:
-        return float("nan")
+    def IS_CHANGED(cls, **kw) -> float|str:
+        """Hash of the programs and every input.
+
+        Stays dirty (nan) only when the output cannot be told from the
+        inputs: feedback shaders (multipass or iPrevFrame), and shaders that
+        read the clock while BATCH is 0 and time keeps running between queues.
+        """
+        sources = [cls.VERTEX, cls.FRAGMENT]
+        for key in [Lexicon.PROG_VERT, Lexicon.PROG_FRAG]:
+            val = kw.get(key, None)
+            val = val[0] if isinstance(val, (list, tuple)) and len(val) else val
+            if isinstance(val, str):
+                sources.append(val)
+
+        for source in sources[1:]:
+            if RE_FEEDBACK.search(source) or len(shader_passes(source)) > 1:
+                return float("nan")
+
+        batch = parse_param(kw, Lexicon.BATCH, EnumConvertType.INT, 0, 0, 1048576)[0]
+        if batch == 0 and any(RE_ANIMATED.search(source) for source in sources[1:]):
+            return float("nan")
+
+        digest = hashlib.sha1()
+        for source in sources:
+            digest.update(source.encode())
+        glsl_digest(digest, kw)
+        return digest.hexdigest()
 
     def __init__(self, *arg, **kw) -> None:
         super().__init__(*arg, **kw)
-        self.__glsl = GLSLShader()
+        self.__glsl = GLSLShader(rgba8=True)
         self.__delta = 0
+        self.__textures = {}
 
     def run(self, ident, **kw) -> tuple[torch.Tensor]:
         batch = parse_param(kw, Lexicon.BATCH, EnumConvertType.INT, 0, 0, 1048576)[0]
@@ -138,37 +208,52 @@ class GLSLNodeBase(JOVImageNode):
             self.__delta = delta
         step = 1. / self.__glsl.fps
 
-        images = []
         batch = max(1, batch)
-        pbar = ProgressBar(batch)
+        frames = []
+        firstImage = None
         for idx in range(batch):
             vars = {}
-            firstImage = None
             for k, v in variables.items():
                 var = v if not isinstance(v, (list, tuple,)) else v[idx % len(v)]
                 if isinstance(var, (torch.Tensor)):
-                    var = tensor2cv(var)
-                    var = image_convert(var, 4)
+                    # hand the shader the same array for the same tensor so
+                    # it can skip re-uploading unchanged textures
+                    cache = self.__textures.get(k, None)
+                    if cache is not None and cache[0] is var:
+                        var = cache[1]
+                    else:
+                        tensor = var
+                        var = tensor2cv(var)
+                        var = image_convert(var, 4)
+                        self.__textures[k] = (tensor, var)
                     if firstImage is None:
                         firstImage = var
                 vars[k] = var
+            frames.append(vars)
 
-            w, h = wihi
-            if firstImage is not None and mode == EnumScaleMode.NONE:
-                h, w = firstImage.shape[:2]
+        w, h = wihi
+        if firstImage is not None and mode == EnumScaleMode.NONE:
+            h, w = firstImage.shape[:2]
+        self.__glsl.size = (w, h)
+        width, height = self.__glsl.size
 
-            self.__glsl.size = (w, h)
+        times = [self.__delta + step * idx for idx in range(batch)]
+        pbar = ProgressBar(batch)
+        def progress(idx:int) -> None:
+            comfy_message(ident, "jovi-glsl-time", {"id": ident, "t": times[idx] + step}, throttle=True)
+            pbar.update_absolute(idx)
 
-            img = self.__glsl.render(self.__delta, **vars)
+        # readback lands directly in this buffer, one frame per slice
+        output = torch.empty((batch, height, width, 4), dtype=torch.uint8)
+        self.__glsl.submit_batch(times, frames, output.numpy(), progress).result()
+        ComfyMessageThrottle().flush(ident, "jovi-glsl-time")
+        self.__delta = times[-1] + step
+
+        images = []
+        for img in output.numpy():
             if mode != EnumScaleMode.NONE:
                 img = image_scalefit(img, w, h, mode, sample)
-            img = cv2tensor_full(img, matte)
-
-            images.append(img)
-
-            self.__delta += step
-            comfy_message(ident, "jovi-glsl-time", {"id": ident, "t": self.__delta})
-            pbar.update_absolute(idx)
+            images.append(cv2tensor_full(img, matte))
         return [torch.cat(i, dim=0) for i in zip(*images)]
 
 class GLSLNode(GLSLNodeBase):
@@ -244,6 +329,164 @@ class GLSLNodeDynamic(GLSLNodeBase):
         original_params['optional'] = data
         return Lexicon._parse(original_params, cls)
 
+class GLSLMetaCache:
+    """On-disk cache of shader_meta() results.
+
+    Entries are keyed by file path and hold the mtime, size and SHA-1 of the
+    source they were parsed from. A file whose mtime and size match is not
+    re-parsed; one that was touched but hashes the same keeps its entry.
+    """
+    def __init__(self, fname:Path) -> None:
+        self.__fname = fname
+        self.__entries: Dict[str, Dict[str, Any]] = {}
+        self.__dirty = False
+        self.__lock = threading.Lock()
+        # hit: mtime and size matched; touched: same hash; parse: shader_meta ran
+        self.__stats = {'hit': 0, 'touched': 0, 'parse': 0}
+        try:
+            if fname.exists():
+                with open(fname, 'r', encoding='utf-8') as f:
+                    self.__entries = json.load(f)
+        except Exception as e:
+            logger.error(f"shader meta cache unreadable {fname}")
+            logger.error(str(e))
+
+    def meta(self, fname:str) -> Tuple[str|None, Dict[str, Any]|None]:
+        """Source and metadata for a shader file, parsing only on a miss."""
+        if (shader := load_file(fname)) is None:
+            return None, None
+
+        stat = os.stat(fname)
+        with self.__lock:
+            entry = self.__entries.get(fname, None)
+            if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                self.__stats['hit'] += 1
+                return shader, entry['meta']
+
+            digest = hashlib.sha1(shader.encode()).hexdigest()
+            if entry is None or entry['hash'] != digest:
+                entry = {'hash': digest, 'meta': shader_meta(shader)}
+                self.__stats['parse'] += 1
+            else:
+                self.__stats['touched'] += 1
+            entry.update({'mtime': stat.st_mtime, 'size': stat.st_size})
+            self.__entries[fname] = entry
+            self.__dirty = True
+            return shader, entry['meta']
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__stats, entries=len(self.__entries))
+
+    def save(self) -> None:
+        with self.__lock:
+            if not self.__dirty:
+                return
+            # forget files that are gone
+            self.__entries = {k: v for k, v in self.__entries.items() if Path(k).exists()}
+            try:
+                self.__fname.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.__fname, 'w', encoding='utf-8') as f:
+                    json.dump(self.__entries, f)
+                self.__dirty = False
+            except Exception as e:
+                logger.error(f"shader meta cache not saved {self.__fname}")
+                logger.error(str(e))
+
+GLSL_META = GLSLMetaCache(JOV_GLSL_CACHE)
+GLSL_SORT = 10000
+
+def glsl_node(name:str, fname:str, shader:str, meta:Dict[str, Any]) -> Tuple[str, type]|None:
+    """Build the dynamic node class for one fragment program."""
+    global GLSL_SORT
+    if meta.get('hide', False):
+        return
+
+    name = meta.get('name', name.split('.')[0])
+    class_name = name.title().replace(' ', '_')
+    class_name = f'GLSLNode_{class_name}'
+
+    emoji = '🧙🏽‍♀️'
+    sort_order = GLSL_SORT
+    if fname.startswith(str(JOV_ROOT_GLSL)):
+        emoji = '🧙🏽'
+        sort_order -= 10000
+
+    class_def = type(class_name, (GLSLNodeDynamic,), {
+        "NAME": f'GLSL {name} (JOV) {emoji}'.upper(),
+        "DESCRIPTION": meta.get('desc', name),
+        "FRAGMENT": shader,
+        "PARAM": [tuple(p) for p in meta.get('_', [])],
+        "SORT": sort_order,
+    })
+
+    GLSL_SORT += 10
+    return class_name, class_def
+
+def glsl_watch(nodes:Dict[str, type]) -> None:
+    """Poll the shader folders and register new or edited fragment programs.
+
+    Every scan builds its changes aside and publishes them by rebinding the
+    program list and the Jovimetrix and ComfyUI node maps, never by mutating
+    a map another thread may be reading. An edited shader gets a fresh class
+    under its old name; new ones appear in the node menu after the frontend
+    refreshes its node list.
+    """
+    import Jovimetrix
+    try:
+        import nodes as comfy_nodes
+    except Exception:
+        comfy_nodes = None
+
+    folders = [JOV_ROOT_GLSL]
+    if USER_GLSL is not None:
+        folders.append(Path(USER_GLSL))
+    seen = {fname: os.stat(fname).st_mtime for fname in GLSL_PROGRAMS['fragment'].values() if Path(fname).exists()}
+
+    while True:
+        time.sleep(JOV_GLSL_WATCH)
+        try:
+            programs = {}
+            classes = {}
+            for folder in folders:
+                for f in Path(folder).rglob('*.frag'):
+                    fname = str(f)
+                    mtime = f.stat().st_mtime
+                    if seen.get(fname, None) == mtime:
+                        continue
+                    seen[fname] = mtime
+                    key = str(f.relative_to(folder))
+                    programs[key] = fname
+                    shader, meta = GLSL_META.meta(fname)
+                    if shader is None:
+                        continue
+
+                    if (ret := glsl_node(key, fname, shader, meta)) is None:
+                        continue
+                    _, class_def = ret
+                    if (node := nodes.get(fname, None)) is not None:
+                        class_def.NAME = node.NAME
+                        class_def.SORT = node.SORT
+                        logger.info(f"shader updated: {node.NAME}")
+                    else:
+                        logger.info(f"shader added: {class_def.NAME}")
+                    nodes[fname] = class_def
+                    classes[class_def.NAME] = class_def
+
+            if len(programs):
+                GLSL_PROGRAMS['fragment'] = {**GLSL_PROGRAMS['fragment'], **programs}
+            if len(classes):
+                names = {k: k for k in classes.keys()}
+                Jovimetrix.NODE_CLASS_MAPPINGS = {**Jovimetrix.NODE_CLASS_MAPPINGS, **classes}
+                Jovimetrix.NODE_DISPLAY_NAME_MAPPINGS = {**Jovimetrix.NODE_DISPLAY_NAME_MAPPINGS, **names}
+                if comfy_nodes is not None:
+                    comfy_nodes.NODE_CLASS_MAPPINGS = {**comfy_nodes.NODE_CLASS_MAPPINGS, **classes}
+                    comfy_nodes.NODE_DISPLAY_NAME_MAPPINGS = {**comfy_nodes.NODE_DISPLAY_NAME_MAPPINGS, **names}
+            GLSL_META.save()
+        except Exception as e:
+            logger.error(str(e))
+
 def import_dynamic() -> Tuple[str,...]:
     ret = []
     global GLSL_PROGRAMS
@@ -255,35 +498,21 @@ def import_dynamic() -> Tuple[str,...]:
         if (shader := load_file(prog)) is not None:
             GLSLShader.PROG_FRAGMENT = shader
 
-    sort = 10000
-    root = str(JOV_ROOT_GLSL)
+    start = time.perf_counter()
+    nodes = {}
     for name, fname in GLSL_PROGRAMS['fragment'].items():
-        if (shader := load_file(fname)) is None:
+        shader, meta = GLSL_META.meta(fname)
+        if shader is None:
             logger.error(f"missing shader file {fname}")
             continue
 
-        meta = shader_meta(shader)
-        if meta.get('hide', False):
+        if (node := glsl_node(name, fname, shader, meta)) is None:
             continue
+        nodes[fname] = node[1]
+        ret.append(node)
+    GLSL_META.save()
+    logger.info(f"{len(ret)} shader nodes in {(time.perf_counter() - start) * 1000:.1f}ms")
 
-        name = meta.get('name', name.split('.')[0])
-        class_name = name.title().replace(' ', '_')
-        class_name = f'GLSLNode_{class_name}'
-
-        emoji = '🧙🏽‍♀️'
-        sort_order = sort
-        if fname.startswith(root):
-            emoji = '🧙🏽'
-            sort_order -= 10000
-
-        class_def = type(class_name, (GLSLNodeDynamic,), {
-            "NAME": f'GLSL {name} (JOV) {emoji}'.upper(),
-            "DESCRIPTION": meta.get('desc', name),
-            "FRAGMENT": shader,
-            "PARAM": meta.get('_', []),
-            "SORT": sort_order,
-        })
-
-        sort += 10
-        ret.append((class_name, class_def,))
+    if JOV_GLSL_WATCH > 0:
+        threading.Thread(target=glsl_watch, args=(nodes,), name="jovi-glsl-watch", daemon=True).start()
     return ret
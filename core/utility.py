@@ -33,7 +33,7 @@ from Jovimetrix.sup.util import parse_dynamic, path_next, \
     parse_param, zip_longest_fill, EnumConvertType
 
 from Jovimetrix.sup.image import cv2tensor, image_convert, image_matte, tensor2cv, \
-    pil2tensor, image_load, image_formats, tensor2pil, MIN_IMAGE_SIZE
+    pil2tensor, image_load, image_formats, tensor2pil, ImageFetcher, MIN_IMAGE_SIZE
 
 # =============================================================================
 
@@ -587,6 +587,10 @@ Manage a queue of items, such as file paths or data. It supports various formats
             # single Q cache to skip loading single entries over and over
             if (val := self.__last_q_value.get(q_data, None)) is not None:
                 return val
+            if ImageFetcher.is_url(q_data):
+                if (data := ImageFetcher().fetch(q_data)) is not None:
+                    self.__last_q_value[q_data] = data
+                return self.__last_q_value.get(q_data, q_data)
             if isinstance(q_data, (str,)):
                 if not os.path.isfile(q_data):
                     return q_data
@@ -633,6 +637,11 @@ Manage a queue of items, such as file paths or data. It supports various formats
             if parse_param(kw, Lexicon.BATCH, EnumConvertType.BOOLEAN, False)[0] == True:
                 data = []
                 mw, mh, mc = 0, 0, 0
+                # pull any remote entries down concurrently before the serial pass
+                urls = [q for q in set(self.__q) if ImageFetcher.is_url(q) and q not in self.__last_q_value]
+                for url, future in zip(urls, ImageFetcher().prefetch(urls)):
+                    if (img := future.result()) is not None:
+                        self.__last_q_value[url] = img
                 pbar = ProgressBar(self.__len)
                 for idx in range(self.__len):
                     ret = process(self.__q[idx])
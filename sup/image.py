@@ -3,28 +3,38 @@ Jovimetrix - http://www.github.com/amorano/jovimetrix
 Image Support
 """
 
+import os
 import math
+import time
+import hashlib
+import functools
 import base64
-import urllib
-import requests
+import urllib.request
+import threading
 from enum import Enum
 from io import BytesIO
-from typing import Any, List, Optional, Tuple, Union
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
 
 import cv2
 import torch
 import numpy as np
-from numba import jit
+from numba import jit, prange
 from daltonlens import simulate
-from sklearn.cluster import MiniBatchKMeans
+from sklearn.cluster import kmeans_plusplus
+from sklearn.metrics import pairwise_distances_argmin
 from scipy import ndimage
 from skimage import exposure
-from skimage.metrics import structural_similarity as ssim
-from PIL import Image, ImageDraw, ImageOps, ImageChops
+from PIL import Image, ImageDraw, ImageOps
 from blendmodes.blend import blendLayers, BlendType
 
 from loguru import logger
 
+from Jovimetrix import Singleton
 from Jovimetrix.sup.util import grid_make
 
 # =============================================================================
@@ -35,6 +45,35 @@ MIN_IMAGE_SIZE = 32
 HALFPI = math.pi / 2
 TAU = math.pi * 2
 
+# remote image fetching -- pool size, megabytes of decoded images kept, (connect, read) timeout
+JOV_FETCH_WORKERS = 8
+JOV_FETCH_CACHE = 512
+JOV_FETCH_TIMEOUT = (3.05, 15)
+try:
+    JOV_FETCH_WORKERS = max(1, int(os.getenv("JOV_FETCH_WORKERS", JOV_FETCH_WORKERS)))
+    JOV_FETCH_CACHE = max(0, int(os.getenv("JOV_FETCH_CACHE", JOV_FETCH_CACHE)))
+except Exception as e:
+    logger.error(str(e))
+
+# palette extraction -- pixels sampled per k-means fit, cached palettes
+JOV_PALETTE_SAMPLES = 65536
+JOV_PALETTE_CACHE = 32
+try:
+    JOV_PALETTE_SAMPLES = max(256, int(os.getenv("JOV_PALETTE_SAMPLES", JOV_PALETTE_SAMPLES)))
+    JOV_PALETTE_CACHE = max(0, int(os.getenv("JOV_PALETTE_CACHE", JOV_PALETTE_CACHE)))
+except Exception as e:
+    logger.error(str(e))
+
+# megabytes of remap coordinate maps kept for the remap_* projections
+JOV_REMAP_CACHE = 256
+try:
+    JOV_REMAP_CACHE = max(0, int(os.getenv("JOV_REMAP_CACHE", JOV_REMAP_CACHE)))
+except Exception as e:
+    logger.error(str(e))
+
+# let grayscale, hsv and blend run through GL (sup.shader) on large inputs
+JOV_GLSL_ACCEL = os.getenv("JOV_GLSL_ACCEL", 'false').strip().lower() in ('true', '1', 't')
+
 # =============================================================================
 # === TYPE SHORTCUTS ===
 # =============================================================================
@@ -65,6 +104,7 @@ class EnumAdjustOP(Enum):
     STACK_BLUR = 1
     GAUSSIAN_BLUR = 2
     MEDIAN_BLUR = 3
+    RANK_FILTER = 4
     SHARPEN = 10
     EMBOSS = 20
     INVERT = 25
@@ -416,6 +456,279 @@ def tensor2pil(tensor: torch.Tensor) -> Image.Image:
     tensor = np.clip(255. * tensor.cpu().numpy().squeeze(), 0, 255).astype(np.uint8)
     return Image.fromarray(tensor)
 
+# =============================================================================
+# === URL FETCH ===
+# =============================================================================
+
+class ImageFetcher(metaclass=Singleton):
+    """Shared remote image loader.
+
+    One pooled `requests.Session` is reused for every request. Decoded images
+    are kept in a bounded LRU along with their ETag/Last-Modified validators so
+    repeat loads become conditional requests (304 skips the download and the
+    decode). The LRU is bounded by `limit` bytes of decoded pixels, so a few
+    4K frames cannot grow it without end. Batches can be prefetched
+    concurrently on a bounded thread pool.
+    """
+    def __init__(self, workers:int=JOV_FETCH_WORKERS, limit:int=JOV_FETCH_CACHE * 1024 * 1024,
+                 timeout:Tuple[float, float]=JOV_FETCH_TIMEOUT) -> None:
+        self.__timeout = timeout
+        self.__limit = limit
+        # url -> (etag, last-modified, decoded image)
+        self.__cache = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+        self.__stats = {'fetch': 0, 'hit': 0, 'miss': 0, 'error': 0}
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=2)
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+        self.__pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jov_fetch")
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Requests made, 304 revalidations, full downloads and failures."""
+        with self.__lock:
+            return dict(self.__stats, size=self.__size, entries=len(self.__cache))
+
+    def __count(self, key: str) -> None:
+        with self.__lock:
+            self.__stats[key] += 1
+
+    @staticmethod
+    def is_url(url: Any) -> bool:
+        return isinstance(url, str) and url.lower().startswith(("http://", "https://"))
+
+    @staticmethod
+    def decode(data: bytes) -> TYPE_IMAGE | None:
+        """Decode raw bytes into a uint8 BGR(A) image, falling back to PIL."""
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            try:
+                image = Image.open(BytesIO(data))
+                image = pil2cv(ImageOps.exif_transpose(image))
+            except Exception as e:
+                logger.error(str(e))
+                return None
+        if image.dtype == np.uint16:
+            image = (image >> 8).astype(np.uint8)
+        elif image.dtype != np.uint8:
+            image = np.clip(image * 255, 0, 255).astype(np.uint8)
+        if image.ndim == 2:
+            image = np.expand_dims(image, -1)
+        return image
+
+    def fetch(self, url: str) -> TYPE_IMAGE | None:
+        """Load a single image. Returns a private copy the caller may modify."""
+        with self.__lock:
+            entry = self.__cache.get(url, None)
+
+        headers = {}
+        if entry is not None:
+            if entry[0]:
+                headers["If-None-Match"] = entry[0]
+            if entry[1]:
+                headers["If-Modified-Since"] = entry[1]
+
+        self.__count('fetch')
+        try:
+            response = self.__session.get(url, headers=headers, timeout=self.__timeout)
+        except requests.RequestException as e:
+            logger.error(f"fetch failed {url}: {e}")
+            self.__count('error')
+            return None if entry is None else entry[2].copy()
+
+        if response.status_code == 304 and entry is not None:
+            with self.__lock:
+                self.__stats['hit'] += 1
+                if url in self.__cache:
+                    self.__cache.move_to_end(url)
+            return entry[2].copy()
+
+        if response.status_code != 200:
+            logger.error(f"fetch failed {url}: HTTP {response.status_code}")
+            self.__count('error')
+            return None if entry is None else entry[2].copy()
+
+        self.__count('miss')
+        if (image := self.decode(response.content)) is None:
+            return None
+
+        if 0 < image.nbytes <= self.__limit:
+            etag = response.headers.get("ETag", None)
+            modified = response.headers.get("Last-Modified", None)
+            with self.__lock:
+                if (old := self.__cache.pop(url, None)) is not None:
+                    self.__size -= old[2].nbytes
+                self.__cache[url] = (etag, modified, image)
+                self.__size += image.nbytes
+                while self.__size > self.__limit:
+                    _, old = self.__cache.popitem(last=False)
+                    self.__size -= old[2].nbytes
+        return image.copy()
+
+    def prefetch(self, urls: List[str]) -> List[Future]:
+        """Queue every url on the worker pool; futures resolve to images (or None)."""
+        return [self.__pool.submit(self.fetch, url) for url in urls]
+
+    def fetch_all(self, urls: List[str]) -> List[TYPE_IMAGE | None]:
+        """Concurrently load a batch of urls, preserving order."""
+        return [f.result() for f in self.prefetch(urls)]
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__cache.clear()
+            self.__size = 0
+
+# =============================================================================
+# === PALETTE ===
+# =============================================================================
+
+class PaletteExtractor(metaclass=Singleton):
+    """Shared k-means palette extraction.
+
+    A fit runs on at most `samples` pixels. They are drawn with a seed taken
+    from the pixel count, so the same image always gives the same sample,
+    and the first centers come from a seeded k-means++. The same pixels and
+    settings therefore always give the same palette. Those palettes are kept
+    in a bounded LRU keyed by a hash of the source pixels and the fit
+    settings, so a batch that reuses its palette source fits once.
+
+    A caller may pass a stream: any hashable it owns, such as one token per
+    node execution. The last palette of that stream then seeds its next fit.
+    This keeps palettes steady from frame to frame and takes fewer
+    iterations. Streamed fits depend on what came before them, so they are
+    never cached or shared with another stream.
+    """
+    def __init__(self, samples:int=JOV_PALETTE_SAMPLES, cache_size:int=JOV_PALETTE_CACHE) -> None:
+        self.__samples = samples
+        self.__cache_size = cache_size
+        # (k, iterations, epsilon, digest) -> centers
+        self.__cache = OrderedDict()
+        # (stream, k, dims) -> centers of the last fit, least recent first
+        self.__last = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__stats = {'hit': 0, 'fit': 0, 'warm': 0, 'fit_ms': 0.}
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats)
+
+    @staticmethod
+    def digest(pixels: np.ndarray) -> str:
+        sha = hashlib.sha1(str((pixels.shape, pixels.dtype.str)).encode())
+        sha.update(np.ascontiguousarray(pixels).data)
+        return sha.hexdigest()
+
+    def sample(self, pixels: np.ndarray) -> np.ndarray:
+        """At most `samples` rows of pixels, the same rows for the same count."""
+        if len(pixels) <= self.__samples:
+            return pixels
+        rng = np.random.default_rng(len(pixels))
+        return pixels[rng.integers(0, len(pixels), self.__samples)]
+
+    def palette(self, pixels: np.ndarray, k: int, stream: Optional[Any]=None,
+                iterations: int=10, epsilon: float=0.2) -> np.ndarray:
+        """k float32 centers for the (N, D) pixels."""
+        pixels = pixels.reshape(len(pixels), -1)
+        key = (k, iterations, epsilon, self.digest(pixels))
+        init = None
+        with self.__lock:
+            if stream is not None:
+                init = self.__last.get((stream, k, pixels.shape[1]), None)
+            elif (centers := self.__cache.get(key, None)) is not None:
+                self.__cache.move_to_end(key)
+                self.__stats['hit'] += 1
+                return centers.copy()
+
+        stamp = time.perf_counter()
+        data = np.float32(self.sample(pixels))
+        k = max(1, min(k, len(data)))
+        warm = init is not None and len(init) == k
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, iterations, epsilon)
+        if not warm:
+            init, _ = kmeans_plusplus(data, k, random_state=0)
+        labels = pairwise_distances_argmin(data, init).astype(np.int32).reshape(-1, 1)
+        _, _, centers = cv2.kmeans(data, k, labels, criteria, 1, cv2.KMEANS_USE_INITIAL_LABELS)
+        elapsed = (time.perf_counter() - stamp) * 1000
+        logger.debug(f"palette k={k}: {len(data)}/{len(pixels)} px, {elapsed:.1f}ms{' warm' if warm else ''}")
+
+        with self.__lock:
+            self.__stats['fit'] += 1
+            self.__stats['warm'] += int(warm)
+            self.__stats['fit_ms'] += elapsed
+            if stream is not None:
+                last = (stream, k, pixels.shape[1])
+                self.__last[last] = centers
+                self.__last.move_to_end(last)
+                while len(self.__last) > max(1, self.__cache_size):
+                    self.__last.popitem(last=False)
+            elif self.__cache_size > 0:
+                self.__cache[key] = centers
+                while len(self.__cache) > self.__cache_size:
+                    self.__cache.popitem(last=False)
+        return centers.copy()
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__cache.clear()
+            self.__last.clear()
+
+# =============================================================================
+# === REMAP ===
+# =============================================================================
+
+class RemapCache(metaclass=Singleton):
+    """Coordinate maps for the remap_* projections.
+
+    A map only depends on the frame size, the projection and its parameters,
+    so it is built once, converted to cv2's fixed point CV_16SC2 form and
+    kept in an LRU bounded by `limit` bytes. A batch with constant parameters
+    builds its map on the first frame only.
+
+    Maps for INTER_NEAREST must be fetched with nearest=True: the default
+    form stores the integer part, which nearest remaps read as a floor.
+    """
+    def __init__(self, limit:int=JOV_REMAP_CACHE * 1024 * 1024) -> None:
+        self.__limit = limit
+        # key -> (map1, map2)
+        self.__cache = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def nbytes(maps: Tuple[np.ndarray, np.ndarray]) -> int:
+        return sum(m.nbytes for m in maps if m is not None)
+
+    def get(self, key: Tuple, build: Callable[[], Tuple[np.ndarray, np.ndarray]],
+            nearest: bool=False) -> Tuple[np.ndarray, np.ndarray]:
+        key = (nearest,) + key
+        with self.__lock:
+            if (maps := self.__cache.get(key, None)) is not None:
+                self.__cache.move_to_end(key)
+                return maps
+
+        map_x, map_y = build()
+        maps = cv2.convertMaps(np.float32(map_x), np.float32(map_y), cv2.CV_16SC2, nninterpolation=nearest)
+        size = self.nbytes(maps)
+        if size > self.__limit:
+            return maps
+
+        with self.__lock:
+            if key not in self.__cache:
+                self.__cache[key] = maps
+                self.__size += size
+            while self.__size > self.__limit:
+                _, old = self.__cache.popitem(last=False)
+                self.__size -= self.nbytes(old)
+        return maps
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__cache.clear()
+            self.__size = 0
+
 # =============================================================================
 # === PIXEL ===
 # =============================================================================
@@ -656,66 +969,176 @@ def image_affine_edge(image: TYPE_IMAGE, callback: object, edge: EnumEdge=EnumEd
     image = image_crop_center(image, width, height)
     return image
 
+def image_warp_affine(image: TYPE_IMAGE, M: np.ndarray, size: Tuple[int, int]=None,
+                      sample: EnumInterpolation=EnumInterpolation.LINEAR,
+                      edge: EnumEdge=EnumEdge.CLIP, border_value: int=0) -> TYPE_IMAGE:
+    """warpAffine with the edge mode handled while sampling.
+
+    WRAP is BORDER_WRAP. WRAPX and WRAPY wrap one axis only: the inverse
+    coordinate maps are built, the wrapped axis is taken modulo the image
+    size and samples that land off the other axis are cleared. No padded copy
+    of the image is ever made.
+    """
+    height, width = image.shape[:2]
+    size = (width, height) if size is None else (int(size[0]), int(size[1]))
+    M = np.asarray(M, dtype=np.float64)[:2]
+    flags = sample.value
+    # warpAffine and remap only resample with these
+    if flags not in [cv2.INTER_NEAREST, cv2.INTER_LINEAR, cv2.INTER_CUBIC, cv2.INTER_LANCZOS4]:
+        flags = cv2.INTER_LINEAR
+
+    if edge == EnumEdge.CLIP:
+        return cv2.warpAffine(image, M, size, flags=flags, borderMode=cv2.BORDER_CONSTANT, borderValue=border_value)
+    if edge == EnumEdge.WRAP:
+        return cv2.warpAffine(image, M, size, flags=flags, borderMode=cv2.BORDER_WRAP)
+
+    inv = cv2.invertAffineTransform(M)
+    xs = np.arange(size[0], dtype=np.float64)
+    ys = np.arange(size[1], dtype=np.float64)[:, None]
+    map_x = (inv[0, 0] * xs + inv[0, 1] * ys + inv[0, 2]).astype(np.float32)
+    map_y = (inv[1, 0] * xs + inv[1, 1] * ys + inv[1, 2]).astype(np.float32)
+    if edge == EnumEdge.WRAPX:
+        np.mod(map_x, width, out=map_x)
+        outside = (map_y < -0.5) | (map_y > height - 0.5)
+    else:
+        np.mod(map_y, height, out=map_y)
+        outside = (map_x < -0.5) | (map_x > width - 0.5)
+    image = cv2.remap(image, map_x, map_y, flags, borderMode=cv2.BORDER_WRAP)
+    image[outside] = border_value
+    return image
+
+def image_accel(op: str, cpu: Callable[[], TYPE_IMAGE], post: Callable[[TYPE_IMAGE], TYPE_IMAGE],
+                width: int, height: int, **kw) -> TYPE_IMAGE:
+    """Run an op on the CPU, or through its GL shader when JOV_GLSL_ACCEL is set
+    and the measured costs say GL is faster. See sup.shader.GLSLImageOps."""
+    global JOV_GLSL_ACCEL
+    if not JOV_GLSL_ACCEL:
+        return cpu()
+    try:
+        # deferred: sup.shader imports this module
+        from Jovimetrix.sup.shader import GLSLImageOps
+    except Exception as e:
+        logger.warning(f"GL image ops unavailable: {e}")
+        JOV_GLSL_ACCEL = False
+        return cpu()
+    return GLSLImageOps().run(op, cpu, post, width, height, **kw)
+
+def image_opaque(image: TYPE_IMAGE) -> bool:
+    """True when the image has no alpha channel or a fully opaque one."""
+    if image.ndim < 3 or image.shape[2] < 4:
+        return True
+    return image[..., 3].min() == 255
+
 def image_blend(imageA: TYPE_IMAGE, imageB: TYPE_IMAGE, mask:Optional[TYPE_IMAGE]=None,
                 blendOp:BlendType=BlendType.NORMAL, alpha:float=1) -> TYPE_IMAGE:
 
     h, w = imageA.shape[:2]
-    imageA = image_convert(imageA, 4)
-    imageA = cv2pil(imageA)
-    imageB = image_convert(imageB, 4)
-    h2, w2 = imageB.shape[:2]
-    w2 = min(w, w2)
-    h2 = min(h, h2)
-    imageB = image_crop_center(imageB, w2, h2)
-    imageB = image_matte(imageB, (0,0,0,0), w, h)
-    imageB = image_convert(imageB, 4)
-    old_mask = image_mask(imageB)
-    if len(old_mask.shape) > 2:
-        old_mask = old_mask[..., 0][:,:]
-
-    if mask is not None:
-        mask = image_crop_center(mask, w, h)
-        mask = image_matte(mask, (0,0,0,0), w, h)
-        if len(mask.shape) > 2:
-            mask = mask[..., 0][:,:]
-        old_mask = cv2.bitwise_and(mask, old_mask)
-
-    imageB[..., 3] = old_mask
-    imageB = cv2pil(imageB)
     alpha = np.clip(alpha, 0, 1)
-    image = blendLayers(imageA, imageB, blendOp.value, alpha)
-    image = pil2cv(image)
-    return image_crop_center(image, w, h)
+
+    def blend() -> TYPE_IMAGE:
+        pA = cv2pil(image_convert(imageA, 4))
+        pB = image_convert(imageB, 4)
+        h2, w2 = pB.shape[:2]
+        w2 = min(w, w2)
+        h2 = min(h, h2)
+        pB = image_crop_center(pB, w2, h2)
+        pB = image_matte(pB, (0,0,0,0), w, h)
+        pB = image_convert(pB, 4)
+        old_mask = image_mask(pB)
+        if len(old_mask.shape) > 2:
+            old_mask = old_mask[..., 0][:,:]
+
+        if mask is not None:
+            new_mask = image_crop_center(mask, w, h)
+            new_mask = image_matte(new_mask, (0,0,0,0), w, h)
+            if len(new_mask.shape) > 2:
+                new_mask = new_mask[..., 0][:,:]
+            old_mask = cv2.bitwise_and(new_mask, old_mask)
+
+        pB[..., 3] = old_mask
+        pB = cv2pil(pB)
+        image = blendLayers(pA, pB, blendOp.value, alpha)
+        image = pil2cv(image)
+        return image_crop_center(image, w, h)
+
+    # two opaque, same size layers blended NORMAL are a plain linear mix;
+    # the alpha scans only matter, and only run, when GL could take it
+    if not JOV_GLSL_ACCEL or blendOp != BlendType.NORMAL or mask is not None or \
+        imageB.shape[:2] != (h, w) or not image_opaque(imageA) or not image_opaque(imageB):
+        return blend()
+    return image_accel('blend', blend, lambda render: render, w, h,
+                       imageA=imageB, imageB=imageA, blend_amt=float(alpha))
+
+CB_SIMULATOR = {
+    EnumCBSimulator.AUTOSELECT: simulate.Simulator_AutoSelect,
+    EnumCBSimulator.BRETTEL1997: simulate.Simulator_Brettel1997,
+    EnumCBSimulator.COBLISV1: simulate.Simulator_CoblisV1,
+    EnumCBSimulator.COBLISV2: simulate.Simulator_CoblisV2,
+    EnumCBSimulator.MACHADO2009: simulate.Simulator_Machado2009,
+    EnumCBSimulator.VIENOT1999: simulate.Simulator_Vienot1999,
+    EnumCBSimulator.VISCHECK: simulate.Simulator_Vischeck,
+}
+
+@functools.lru_cache(maxsize=32)
+def color_blind_lut(deficiency:EnumCBDeficiency,
+                    simulator:EnumCBSimulator=EnumCBSimulator.AUTOSELECT,
+                    severity:float=1.0, size:int=52) -> np.ndarray:
+    """The daltonlens simulation sampled on a size^3 grid.
+
+    Node i sits exactly at i*255/(size-1), where kernel_lut3d expects it.
+    The default puts the nodes on whole levels 5 apart.
+
+    Returns a read-only (size, size, size, 3) float32 table indexed and
+    valued in BGR order, for kernel_lut3d.
+    """
+    levels = np.linspace(0, 255, size, dtype=np.float32)
+    b, g, r = np.meshgrid(levels, levels, levels, indexing='ij')
+    grid = np.stack([r, g, b], axis=-1).reshape(size * size, size, 3)
+    grid = CB_SIMULATOR[simulator]().simulate_cvd(grid, deficiency.value, severity=severity)
+    lut = grid.reshape(size, size, size, 3)[..., ::-1].astype(np.float32)
+    lut.setflags(write=False)
+    return lut
+
+@jit(nopython=True, parallel=True, cache=True)
+def kernel_lut3d(image: TYPE_IMAGE, lut: np.ndarray, out: TYPE_IMAGE) -> None:
+    """Trilinear lookup of every uint8 pixel of image in an (N, N, N, 3) table."""
+    height, width = image.shape[:2]
+    n = lut.shape[0] - 1
+    scale = n / 255.
+    for y in prange(height):
+        for x in range(width):
+            f0 = image[y, x, 0] * scale
+            f1 = image[y, x, 1] * scale
+            f2 = image[y, x, 2] * scale
+            i0 = min(int(f0), n - 1)
+            i1 = min(int(f1), n - 1)
+            i2 = min(int(f2), n - 1)
+            d0 = f0 - i0
+            d1 = f1 - i1
+            d2 = f2 - i2
+            for c in range(3):
+                c00 = lut[i0, i1, i2, c] * (1 - d2) + lut[i0, i1, i2 + 1, c] * d2
+                c01 = lut[i0, i1 + 1, i2, c] * (1 - d2) + lut[i0, i1 + 1, i2 + 1, c] * d2
+                c10 = lut[i0 + 1, i1, i2, c] * (1 - d2) + lut[i0 + 1, i1, i2 + 1, c] * d2
+                c11 = lut[i0 + 1, i1 + 1, i2, c] * (1 - d2) + lut[i0 + 1, i1 + 1, i2 + 1, c] * d2
+                v = (c00 * (1 - d1) + c01 * d1) * (1 - d0) + (c10 * (1 - d1) + c11 * d1) * d0
+                out[y, x, c] = min(255, max(0, int(v + 0.5)))
 
 def image_color_blind(image: TYPE_IMAGE, deficiency:EnumCBDeficiency,
                     simulator:EnumCBSimulator=EnumCBSimulator.AUTOSELECT,
                     severity:float=1.0) -> TYPE_IMAGE:
-
+    """Simulate a colour vision deficiency through the cached 3D LUT of
+    (deficiency, simulator, severity)."""
     cc = image.shape[2] if image.ndim == 3 else 1
     if cc == 4:
         mask = image_mask(image)
-    image = image_convert(image, 3)
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    match simulator:
-        case EnumCBSimulator.AUTOSELECT:
-            simulator = simulate.Simulator_AutoSelect()
-        case EnumCBSimulator.BRETTEL1997:
-            simulator = simulate.Simulator_Brettel1997()
-        case EnumCBSimulator.COBLISV1:
-            simulator = simulate.Simulator_CoblisV1()
-        case EnumCBSimulator.COBLISV2:
-            simulator = simulate.Simulator_CoblisV2()
-        case EnumCBSimulator.MACHADO2009:
-            simulator = simulate.Simulator_Machado2009()
-        case EnumCBSimulator.VIENOT1999:
-            simulator = simulate.Simulator_Vienot1999()
-        case EnumCBSimulator.VISCHECK:
-            simulator = simulate.Simulator_Vischeck()
-    image = simulator.simulate_cvd(image, deficiency.value, severity=severity)
-    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    image = np.ascontiguousarray(image_convert(image, 3))
+    lut = color_blind_lut(deficiency, simulator, float(severity))
+    out = np.empty_like(image)
+    kernel_lut3d(image, lut, out)
     if cc == 4:
-        image = image_mask_add(image, mask)
-    return image
+        out = image_mask_add(out, mask)
+    return out
 
 def image_contrast(image: TYPE_IMAGE, value: float) -> TYPE_IMAGE:
     image, alpha, cc = image2bgr(image)
@@ -998,6 +1421,58 @@ def image_detect(image: TYPE_IMAGE) -> Tuple[TYPE_IMAGE, Tuple[int, ...]]:
     cropped_image = image[y:y+h, x:x+w]
     return cropped_image, (x, y, w, h)
 
+def image_ssim(grayA: TYPE_IMAGE, grayB: TYPE_IMAGE, gaussian: bool=False,
+               tile: int=512) -> Tuple[float, np.ndarray]:
+    """Mean SSIM and the full SSIM map of two single channel images.
+
+    Follows skimage's structural_similarity defaults (7x7 box window, or an
+    11x11 sigma 1.5 gaussian, sample covariance, reflected borders, mean over
+    the un-padded interior) using separable float32 OpenCV filters. Work is
+    done in tiles with a halo of the window radius to bound memory; a tile
+    whose pixels (halo included) are identical in both inputs is exactly 1
+    and skips the filtering.
+    """
+    if grayA.ndim == 3:
+        grayA = grayA[..., 0]
+    if grayB.ndim == 3:
+        grayB = grayB[..., 0]
+    height, width = grayA.shape[:2]
+    data_range = 255. if grayA.dtype == np.uint8 else float(max(grayA.max(), grayB.max()) - min(grayA.min(), grayB.min()) or 1)
+    win = 11 if gaussian else 7
+    pad = (win - 1) // 2
+    cov_norm = win * win / (win * win - 1.)
+    C1 = (0.01 * data_range) ** 2
+    C2 = (0.03 * data_range) ** 2
+
+    def blur(x: np.ndarray) -> np.ndarray:
+        if gaussian:
+            return cv2.GaussianBlur(x, (win, win), 1.5, borderType=cv2.BORDER_REFLECT)
+        return cv2.boxFilter(x, cv2.CV_32F, (win, win), normalize=True, borderType=cv2.BORDER_REFLECT)
+
+    out = np.ones((height, width), dtype=np.float32)
+    for y in range(0, height, tile):
+        for x in range(0, width, tile):
+            y0, y1 = max(0, y - pad), min(height, y + tile + pad)
+            x0, x1 = max(0, x - pad), min(width, x + tile + pad)
+            a = grayA[y0:y1, x0:x1]
+            b = grayB[y0:y1, x0:x1]
+            if cv2.norm(a, b, cv2.NORM_INF) == 0:
+                continue
+            a = a.astype(np.float32)
+            b = b.astype(np.float32)
+            ux = blur(a)
+            uy = blur(b)
+            vx = cov_norm * (blur(a * a) - ux * ux)
+            vy = cov_norm * (blur(b * b) - uy * uy)
+            vxy = cov_norm * (blur(a * b) - ux * uy)
+            S = ((2 * ux * uy + C1) * (2 * vxy + C2)) / ((ux * ux + uy * uy + C1) * (vx + vy + C2))
+            ty, tx = y - y0, x - x0
+            th, tw = min(tile, height - y), min(tile, width - x)
+            out[y:y+th, x:x+tw] = S[ty:ty+th, tx:tx+tw]
+
+    score = float(out[pad:height-pad, pad:width-pad].mean(dtype=np.float64))
+    return score, out
+
 def image_diff(imageA: TYPE_IMAGE, imageB: TYPE_IMAGE, threshold:int=0, color:TYPE_PIXEL=(255, 0, 0)) -> Tuple[TYPE_IMAGE, TYPE_IMAGE, TYPE_IMAGE, TYPE_IMAGE, float]:
     """imageA, imageB, diff, thresh, score
     """
@@ -1011,28 +1486,17 @@ def image_diff(imageA: TYPE_IMAGE, imageB: TYPE_IMAGE, threshold:int=0, color:TY
     imageB = image_convert(imageB, 3)
     grayA = image_grayscale(imageA)
     grayB = image_grayscale(imageB)
-    (score, diff) = ssim(grayA, grayB, full=True, channel_axis=2)
+    (score, diff) = image_ssim(grayA, grayB)
     diff = (diff * 255).astype("uint8")
-    diff_box = cv2.merge([diff, diff, diff])
     _, thresh = cv2.threshold(diff, threshold, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
     contours = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     contours = contours[0] if len(contours) == 2 else contours[1]
-    high_a = imageA.copy()
-    high_a = image_convert(high_a, 3)
-    high_b = imageB.copy()
-    high_b = image_convert(high_b, 3)
-    for c in contours:
-        area = cv2.contourArea(c)
-        if area > 40:
-            x,y,w,h = cv2.boundingRect(c)
-            cv2.rectangle(imageA, (x, y), (x + w, y + h), (36,255,12), 2)
-            cv2.rectangle(imageB, (x, y), (x + w, y + h), (36,255,12), 2)
-            cv2.rectangle(diff_box, (x, y), (x + w, y + h), (36,255,12), 2)
-        cv2.drawContours(high_a, [c], 0, color[::-1], -1)
-        cv2.drawContours(high_b, [c], 0, color[::-1], -1)
-        cv2.drawContours(diff_box, [c], 0, color[::-1], -1)
-    imageA = cv2.addWeighted(imageA, 0.0, high_a, 1, 0)
-    imageB = cv2.addWeighted(imageB, 0.0, high_b, 1, 0)
+    # every region filled in one call per image
+    imageA = imageA.copy()
+    imageB = imageB.copy()
+    if len(contours):
+        cv2.drawContours(imageA, contours, -1, color[::-1], -1)
+        cv2.drawContours(imageB, contours, -1, color[::-1], -1)
     return imageA, imageB, diff, thresh, score
 
 def image_disparity(imageA: np.ndarray) -> np.ndarray:
@@ -1060,55 +1524,73 @@ def image_exposure(image: TYPE_IMAGE, value: float) -> TYPE_IMAGE:
     image = np.clip(image * value, 0, 255).astype(np.uint8)
     return bgr2image(image, alpha, cc == 1)
 
-def image_filter(image:TYPE_IMAGE, start:Tuple[int]=(128,128,128), end:Tuple[int]=(128,128,128), fuzz:Tuple[float]=(0.5,0.5,0.5), use_range:bool=False) -> Tuple[TYPE_IMAGE, TYPE_IMAGE]:
+@functools.lru_cache(maxsize=64)
+def image_filter_bounds(start:Tuple[float, ...], end:Tuple[float, ...], fuzz:Tuple[float, ...],
+                        use_range:bool=False, hsv:bool=False) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """Inclusive uint8 (lower, upper) cv2.inRange bounds for image_filter.
+
+    They pass exactly the pixels the old float test passed. With hsv the
+    start and end colors are converted to HSV_FULL first.
+    """
+    start = np.float64(start)
+    end = np.float64(end)
+    if hsv:
+        color = np.uint8(np.stack([start, end]).clip(0, 255)).reshape(1, 2, 3)
+        color = cv2.cvtColor(color, cv2.COLOR_BGR2HSV_FULL)[0]
+        start, end = np.float64(color[0]), np.float64(color[1])
+
+    # the same float64 bounds as the old tensor code -- without a range the
+    # fuzz is taken off and put back on the single start point
+    fuzz = np.float64(fuzz)
+    lo = start / 255.
+    if use_range:
+        hi = end / 255. + fuzz
+        lo = lo - fuzz
+    else:
+        lo = (lo - fuzz) + fuzz
+        hi = lo
+    lo = np.float32(np.clip(lo, 0., 1.))
+    hi = np.float32(np.clip(hi, 0., 1.))
+
+    # pixels were compared as float32 v / 255; find the uint8 range that passes
+    levels = np.arange(256, dtype=np.float32) / np.float32(255.)
+    lower = tuple(int(np.searchsorted(levels, lo[c], side='left')) for c in range(3))
+    upper = tuple(int(np.searchsorted(levels, hi[c], side='right')) - 1 for c in range(3))
+    return lower, upper
+
+def image_filter(image:TYPE_IMAGE, start:Tuple[int]=(128,128,128), end:Tuple[int]=(128,128,128), fuzz:Tuple[float]=(0.5,0.5,0.5), use_range:bool=False, hsv:bool=False) -> Tuple[TYPE_IMAGE, TYPE_IMAGE]:
     """Filter an image based on a range threshold.
     It can use a start point with fuzziness factor and/or a start and end point with fuzziness on both points.
 
     Args:
-        image (np.ndarray): Input image in the form of a NumPy array.
+        image (np.ndarray): Input image in the form of a NumPy array, or a BxHxWxC batch.
         start (tuple): The lower bound of the color range to be filtered.
         end (tuple): The upper bound of the color range to be filtered.
         fuzz (float): A factor for adding fuzziness (tolerance) to the color range.
         use_range (bool): Boolean indicating whether to use a start and end range or just the start point with fuzziness.
+        hsv (bool): Compare in HSV (0-255 hue) instead of the image channels; start and end are converted alongside.
 
     Returns:
         Tuple[np.ndarray, np.ndarray]: A tuple containing the filtered image and the mask.
     """
-    old_alpha = None
-    image: torch.tensor = cv2tensor(image)
-    cc = image.shape[2]
-    if cc == 4:
-        old_alpha = image[..., 3]
-        new_image = image[:, :, :3]
-    elif cc == 1:
-        new_image = np.repeat(image, 3, axis=2)
-    else:
-        new_image = image
-
-    fuzz = torch.tensor(fuzz, dtype=torch.float64, device="cpu")
-    start = torch.tensor(start, dtype=torch.float64, device="cpu") / 255.
-    end = torch.tensor(end, dtype=torch.float64, device="cpu") / 255.
-    if not use_range:
-        end = start
-    start -= fuzz
-    end += fuzz
-    start = torch.clamp(start, 0.0, 1.0)
-    end = torch.clamp(end, 0.0, 1.0)
-
-    mask = ((new_image[..., 0] > start[0]) & (new_image[..., 0] < end[0]))
-    #mask |= ((new_image[..., 1] > start[1]) & (new_image[..., 1] < end[1]))
-    #mask |= ((new_image[..., 2] > start[2]) & (new_image[..., 2] < end[2]))
-    mask = ((new_image[..., 0] >= start[0]) & (new_image[..., 0] <= end[0]) &
-            (new_image[..., 1] >= start[1]) & (new_image[..., 1] <= end[1]) &
-            (new_image[..., 2] >= start[2]) & (new_image[..., 2] <= end[2]))
-
-    output_image = torch.zeros_like(new_image)
-    output_image[mask] = new_image[mask]
-
-    if old_alpha is not None:
-        output_image = torch.cat([output_image, old_alpha.unsqueeze(2)], dim=2)
-
-    return tensor2cv(output_image), mask.cpu().numpy().astype(np.uint8) * 255
+    if image.ndim == 2:
+        image = image[..., None]
+    if image.shape[-1] == 1:
+        image = np.repeat(image, 3, axis=-1)
+    shape = image.shape
+    # a batch is stacked into one tall frame
+    image = np.ascontiguousarray(image).reshape(-1, shape[-2], shape[-1])
+    test = image[..., :3]
+    if hsv:
+        test = cv2.cvtColor(np.ascontiguousarray(test), cv2.COLOR_BGR2HSV_FULL)
+
+    fuzz = tuple(float(f) for f in np.broadcast_to(np.float64(fuzz), (3,)))
+    lower, upper = image_filter_bounds(tuple(float(c) for c in start[:3]), tuple(float(c) for c in end[:3]),
+                                       fuzz, bool(use_range), bool(hsv))
+    mask = cv2.inRange(np.ascontiguousarray(test), lower, upper)
+
+    output_image = cv2.bitwise_and(image, image, mask=mask)
+    return output_image.reshape(shape), mask.reshape(shape[:-1])
 
 def image_formats() -> List[str]:
     exts = Image.registered_extensions()
@@ -1136,43 +1618,88 @@ def image_gradient_map2(image, gradient_map):
     np.take(cmap.reshape(-1, 3), grey_reshaped, axis=0, out=result.reshape(-1, 3))
     return result
 
-def image_gradient(width:int, height:int, color_map:dict=None) -> TYPE_IMAGE:
+def gradient_stops(color_map:dict=None) -> Tuple[Tuple[float, Tuple[int, int, int]], ...]:
+    """Clamp and sort gradient stops into a hashable (position, (r, g, b)) tuple."""
     if color_map is None:
         color_map = {0: (0,0,0,255)}
     else:
         color_map = {np.clip(float(k), 0, 1): [np.clip(int(c), 0, 255) for c in v] for k, v in color_map.items()}
-    color_map = dict(sorted(color_map.items()))
-    image = Image.new('RGBA', (width, height))
-    draw = image.load()
+    return tuple((float(k), tuple(int(c) for c in v[:3])) for k, v in sorted(color_map.items()))
+
+@functools.lru_cache(maxsize=64)
+def gradient_ramp(width:int, stops:Tuple[Tuple[float, Tuple[int, int, int]], ...]) -> TYPE_IMAGE:
+    """One (width, 4) BGRA row of Gaussian blended colour stops.
+
+    Every stop is evaluated for every column in a single pass. Rows are
+    cached by (width, stops) and returned read-only.
+    """
     widthf = float(width)
+    x = np.arange(width, dtype=np.float64)[:, None]
+    pos = np.array([k for k, _ in stops], dtype=np.float64) * widthf
+    rgb = np.array([c for _, c in stops], dtype=np.float64)
+    ws = widthf / len(stops)
+    weight = np.exp(-(x - pos) ** 2 / (2 * ws ** 2))
+    color = np.minimum(255, (weight @ rgb).astype(np.int64))
+    ramp = np.empty((width, 4), dtype=np.uint8)
+    ramp[:, :3] = color[:, ::-1]
+    ramp[:, 3] = 255
+    ramp.setflags(write=False)
+    return ramp
 
-    @jit
-    def gaussian(x, a, b, c, d=0) -> Any:
-        return a * math.exp(-(x - b)**2 / (2 * c**2)) + d
+def image_gradient(width:int, height:int, color_map:dict=None) -> TYPE_IMAGE:
+    """Horizontal gradient of the color_map stops as a BGRA image.
 
-    def pixel(x, spread:int=1) -> Tuple[int, int, int]:
-        ws = widthf / (spread * len(color_map))
-        r = sum([gaussian(x, p[0], k * widthf, ws) for k, p in color_map.items()])
-        g = sum([gaussian(x, p[1], k * widthf, ws) for k, p in color_map.items()])
-        b = sum([gaussian(x, p[2], k * widthf, ws) for k, p in color_map.items()])
-        return min(255, int(r)), min(255, int(g)), min(255, int(b))
+    The cached row is repeated into a new, writable image.
+    """
+    ramp = gradient_ramp(width, gradient_stops(color_map))
+    return np.ascontiguousarray(np.broadcast_to(ramp[None, :, :], (height, width, 4)))
 
-    for x in range(width):
-        r, g, b = pixel(x)
-        for y in range(height):
-            draw[x, y] = r, g, b
-    return pil2cv(image)
+# (digest, reverse) of a gradient image -> its 256 entry table
+GRADIENT_TABLE = OrderedDict()
+GRADIENT_TABLE_SIZE = 32
+GRADIENT_TABLE_LOCK = threading.Lock()
+
+def gradient_table(gradient_map:TYPE_IMAGE, reverse:bool=False) -> TYPE_IMAGE:
+    """The (256, 1, 3) colour table of a gradient image: its top row once the
+    image is stretched to 256x256.
+
+    Tables are kept by a digest of the image, so a batch that maps every
+    frame through the same gradient builds it once. Returned read-only.
+    """
+    key = (PaletteExtractor.digest(gradient_map), reverse)
+    with GRADIENT_TABLE_LOCK:
+        if (table := GRADIENT_TABLE.get(key, None)) is not None:
+            GRADIENT_TABLE.move_to_end(key)
+            return table
 
-# Adapted from WAS Suite -- gradient_map
-# https://github.com/WASasquatch/was-node-suite-comfyui
-def image_gradient_map(image:TYPE_IMAGE, gradient_map:TYPE_IMAGE, reverse:bool=False) -> TYPE_IMAGE:
     if reverse:
         gradient_map = gradient_map[:,:,::-1]
-    grey = image_grayscale(image)
     cmap = image_convert(gradient_map, 3)
     cmap = cv2.resize(cmap, (256, 256))
-    cmap = cmap[0,:,:].reshape((256, 1, 3)).astype(np.uint8)
-    return cv2.applyColorMap(grey, cmap)
+    table = np.ascontiguousarray(cmap[0,:,:].reshape((256, 1, 3)).astype(np.uint8))
+    table.setflags(write=False)
+    with GRADIENT_TABLE_LOCK:
+        GRADIENT_TABLE[key] = table
+        while len(GRADIENT_TABLE) > GRADIENT_TABLE_SIZE:
+            GRADIENT_TABLE.popitem(last=False)
+    return table
+
+# Adapted from WAS Suite -- gradient_map
+# https://github.com/WASasquatch/was-node-suite-comfyui
+def image_gradient_map(image:TYPE_IMAGE, gradient_map:Union[TYPE_IMAGE, dict], reverse:bool=False) -> TYPE_IMAGE:
+    """Remap the grayscale of image through a 256 entry gradient.
+
+    gradient_map is an image, whose top row is stretched into the table, or
+    color stops as for image_gradient. Either way the table is cached.
+    """
+    grey = image_grayscale(image)
+    if isinstance(gradient_map, dict):
+        cmap = gradient_ramp(256, gradient_stops(gradient_map))[:, :3]
+        if reverse:
+            cmap = cmap[:, ::-1]
+        cmap = np.ascontiguousarray(cmap).reshape((256, 1, 3))
+        return cv2.applyColorMap(grey, cmap)
+    return cv2.applyColorMap(grey, gradient_table(gradient_map, reverse))
 
 def image_grayscale(image: TYPE_IMAGE, use_alpha: bool = False) -> TYPE_IMAGE:
     """Convert image to grayscale, optionally using the alpha channel if present.
@@ -1188,17 +1715,28 @@ def image_grayscale(image: TYPE_IMAGE, use_alpha: bool = False) -> TYPE_IMAGE:
     if image.ndim == 2 or image.shape[2] == 1:
         return image
 
-    if image.shape[2] == 4:
-        # Convert RGBA to grayscale
-        grayscale = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
-        if use_alpha:
-            # Normalize alpha to [0, 1]
-            alpha_channel = image[:, :, 3] / 255.0
-            grayscale = (grayscale * alpha_channel).astype(np.uint8)
-        return grayscale
+    use_alpha = use_alpha and image.shape[2] == 4
 
-    # Convert RGB to grayscale
-    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def alpha(grayscale: TYPE_IMAGE) -> TYPE_IMAGE:
+        # Normalize alpha to [0, 1]
+        alpha_channel = image[:, :, 3] / 255.0
+        return (grayscale * alpha_channel).astype(np.uint8)
+
+    def convert() -> TYPE_IMAGE:
+        if image.shape[2] == 4:
+            # Convert RGBA to grayscale
+            grayscale = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+            return alpha(grayscale) if use_alpha else grayscale
+        # Convert RGB to grayscale
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    def post(render: TYPE_IMAGE) -> TYPE_IMAGE:
+        grayscale = np.ascontiguousarray(render[..., 0])
+        return alpha(grayscale) if use_alpha else grayscale
+
+    h, w = image.shape[:2]
+    # cv2 weights in BGR order
+    return image_accel('grayscale', convert, post, w, h, image=image, convert=(0.114, 0.587, 0.299))
 
 def image_grid(data: List[TYPE_IMAGE], width: int, height: int) -> TYPE_IMAGE:
     #@TODO: makes poor assumption all images are the same dimensions.
@@ -1217,46 +1755,96 @@ def image_grid(data: List[TYPE_IMAGE], width: int, height: int) -> TYPE_IMAGE:
 
     return frame
 
-def image_histogram(image:TYPE_IMAGE, bins=256) -> TYPE_IMAGE:
-    bins = max(image.max(), bins) + 1
-    flatImage = image.flatten()
-    histogram = np.zeros(bins)
-    for pixel in flatImage:
-        histogram[pixel] += 1
+def image_histogram(image:TYPE_IMAGE, bins:int=256) -> np.ndarray:
+    """Per channel histogram of an image, or of a whole batch in one call.
+
+    Takes HxW, HxWxC or BxHxWxC data and returns a (C, bins) array of counts
+    over the 0-255 range. Anything that is not uint8 is clipped into it.
+    """
+    if image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    cc = image.shape[-1] if image.ndim > 2 else 1
+    # every frame stacked into one tall image; a view for contiguous data
+    flat = np.ascontiguousarray(image).reshape(-1, image.shape[-2] if image.ndim > 2 else image.shape[-1], cc)
+    histogram = np.zeros((cc, bins), dtype=np.int64)
+    # calcHist counts in float32, exact up to 2**24 per call
+    rows = max(1, (1 << 24) // flat.shape[1])
+    for y in range(0, flat.shape[0], rows):
+        chunk = flat[y:y+rows]
+        for c in range(cc):
+            # (bins, 1) before OpenCV 5, (bins,) after
+            histogram[c] += cv2.calcHist([chunk], [c], None, [bins], [0, 256]).reshape(-1).astype(np.int64)
     return histogram
 
 def image_histogram_normalize(image:TYPE_IMAGE)-> TYPE_IMAGE:
-    L = image.max()
-    nonEqualizedHistogram = image_histogram(image, bins=L)
-    sumPixels = np.sum(nonEqualizedHistogram)
-    nonEqualizedHistogram = nonEqualizedHistogram/sumPixels
-    cfdHistogram = np.cumsum(nonEqualizedHistogram)
-    transformMap = np.floor((L-1) * cfdHistogram)
-    flatNonEqualizedImage = list(image.flatten())
-    flatEqualizedImage = [transformMap[p] for p in flatNonEqualizedImage]
-    return np.reshape(flatEqualizedImage, image.shape)
+    """Equalize an image (or batch) with one histogram over all channels.
+
+    The equalization is a single 256 entry lookup table applied with cv2.LUT.
+    """
+    if image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    if (L := int(image.max())) == 0:
+        return image.copy()
+    histogram = image_histogram(image).sum(axis=0)
+    cfdHistogram = np.cumsum(histogram / histogram.sum())
+    transformMap = np.floor((L-1) * cfdHistogram).astype(np.uint8)
+    # cv2 wants 2D/3D frames with at most 4 channels; stack a batch into one
+    flat = np.ascontiguousarray(image)
+    if flat.ndim > 3:
+        flat = flat.reshape(-1, *flat.shape[-2:])
+    return cv2.LUT(flat, transformMap).reshape(image.shape)
 
 def image_histogram_statistics(histogram:np.ndarray, L=256)-> TYPE_IMAGE:
-    sumPixels = np.sum(histogram)
-    normalizedHistogram = histogram/sumPixels
-    mean = 0
-    for i in range(L):
-        mean += i * normalizedHistogram[i]
-    variance = 0
-    for i in range(L):
-        variance += (i-mean)**2 * normalizedHistogram[i]
+    """Mean, variance and standard deviation from a histogram.
+
+    histogram is (bins,) or the (C, bins) from image_histogram; the results
+    are scalars or per channel arrays to match.
+    """
+    histogram = histogram[..., :L]
+    normalizedHistogram = histogram / np.sum(histogram, axis=-1, keepdims=True)
+    levels = np.arange(histogram.shape[-1])
+    mean = normalizedHistogram @ levels
+    variance = normalizedHistogram @ (levels ** 2) - mean ** 2
+    variance = np.maximum(variance, 0)
     std = np.sqrt(variance)
     return mean, variance, std
 
+def image_histogram_percentile(histogram:np.ndarray, q:Union[float, List[float]]) -> np.ndarray:
+    """Level at percentile(s) q (0-100) from a (bins,) or (C, bins) histogram.
+
+    Returns an array shaped [C,] len(q), the same levels np.percentile gives
+    on the pixels themselves with method="lower".
+    """
+    q = np.atleast_1d(np.asarray(q, dtype=np.float64)) / 100.
+    cumulative = np.cumsum(histogram, axis=-1)
+    # the rank each percentile lands on, then the first level past it
+    rank = np.floor(q * (cumulative[..., -1:] - 1))
+    return np.argmax(cumulative[..., None, :] > rank[..., None], axis=-1)
+
+def image_histogram_entropy(histogram:np.ndarray) -> np.ndarray:
+    """Shannon entropy, in bits, of a (bins,) or (C, bins) histogram."""
+    p = histogram / np.sum(histogram, axis=-1, keepdims=True)
+    logp = np.log2(p, out=np.zeros_like(p, dtype=np.float64), where=p > 0)
+    return -np.sum(p * logp, axis=-1)
+
 def image_hsv(image: TYPE_IMAGE, hue: float, saturation: float, value: float) -> TYPE_IMAGE:
-    image, alpha, cc = image2bgr(image)
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    hue *= 255
-    image[:, :, 0] = (image[:, :, 0] + hue) % 180
-    image[:, :, 1] = np.clip(image[:, :, 1] * saturation, 0, 255)
-    image[:, :, 2] = np.clip(image[:, :, 2] * value, 0, 255)
-    image = cv2.cvtColor(image, cv2.COLOR_HSV2BGR)
-    return bgr2image(image, alpha, cc == 1)
+
+    def adjust() -> TYPE_IMAGE:
+        img, alpha, cc = image2bgr(image)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        img[:, :, 0] = (img[:, :, 0] + hue * 255) % 180
+        img[:, :, 1] = np.clip(img[:, :, 1] * saturation, 0, 255)
+        img[:, :, 2] = np.clip(img[:, :, 2] * value, 0, 255)
+        img = cv2.cvtColor(img, cv2.COLOR_HSV2BGR)
+        return bgr2image(img, alpha, cc == 1)
+
+    if image.ndim == 2 or image.shape[2] == 1:
+        return adjust()
+    h, w = image.shape[:2]
+    # cv2 hue spans 0-180, the shader's 0-1
+    shift = (hue * 255 / 180) % 1
+    return image_accel('hsv', adjust, lambda render: render, w, h,
+                       image=image, adjust=(shift, saturation, value))
 
 def image_invert(image: TYPE_IMAGE, value: float) -> TYPE_IMAGE:
     value = np.clip(value, 0, 1)
@@ -1376,16 +1964,16 @@ def image_load_exr(url: str) -> Tuple[TYPE_IMAGE, TYPE_IMAGE]:
 
 def image_load_from_url(url: str) -> TYPE_IMAGE:
     """Creates a CV2 BGR image from a url."""
+    if ImageFetcher.is_url(url):
+        if (image := ImageFetcher().fetch(url)) is not None:
+            return image_convert(image, 3)
+        return
     try:
-        image  = urllib.request.urlopen(url)
+        image = urllib.request.urlopen(url)
         image = np.asarray(bytearray(image.read()), dtype=np.uint8)
         return cv2.imdecode(image, cv2.IMREAD_COLOR)
-    except:
-        try:
-            image = Image.open(requests.get(url, stream=True).raw)
-            return pil2cv(image)
-        except Exception as e:
-            logger.error(str(e))
+    except Exception as e:
+        logger.error(str(e))
 
 def image_mask(image:TYPE_IMAGE, color:TYPE_PIXEL=255) -> TYPE_IMAGE:
     """Create a mask from the image, preserving transparency."""
@@ -1599,13 +2187,21 @@ def image_posterize(image: TYPE_IMAGE, levels:int=256) -> TYPE_IMAGE:
     divisor = 256 / max(2, min(256, levels))
     return (np.floor(image / divisor) * int(divisor)).astype(np.uint8)
 
-def image_quantize(image:TYPE_IMAGE, levels:int=256, iterations:int=10, epsilon:float=0.2) -> TYPE_IMAGE:
+def image_quantize(image:TYPE_IMAGE, levels:int=256, iterations:int=10, epsilon:float=0.2,
+                   stream:Optional[Any]=None) -> TYPE_IMAGE:
+    """Reduce image to a `levels` color k-means palette.
+
+    The palette is fit on a sample of the pixels (see PaletteExtractor) and
+    every pixel is then mapped to its nearest center. Frames quantized with
+    the same stream token warm-start from the previous frame's palette.
+    """
     levels = int(max(2, min(256, levels)))
-    pixels = np.float32(image)
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, iterations, epsilon)
-    _, labels, centers = cv2.kmeans(pixels, levels, None, criteria, 5, cv2.KMEANS_RANDOM_CENTERS)
+    cc = image.shape[2] if image.ndim == 3 else 1
+    pixels = image.reshape(-1, cc)
+    centers = PaletteExtractor().palette(pixels, levels, stream, iterations, epsilon)
+    labels = pairwise_distances_argmin(np.float32(pixels), centers)
     centers = np.uint8(centers)
-    return centers[labels.flatten()].reshape(image.shape)
+    return centers[labels].reshape(image.shape)
 
 def image_recenter(image: TYPE_IMAGE) -> TYPE_IMAGE:
     cropped_image = image_detect(image)[0]
@@ -1615,16 +2211,52 @@ def image_recenter(image: TYPE_IMAGE) -> TYPE_IMAGE:
     new_image[paste_y:paste_y+cropped_image.shape[0], paste_x:paste_x+cropped_image.shape[1]] = cropped_image
     return new_image
 
-def image_rotate(image: TYPE_IMAGE, angle: float, center:TYPE_COORD=(0.5, 0.5), edge:EnumEdge=EnumEdge.CLIP) -> TYPE_IMAGE:
+def image_rank_filter(image: TYPE_IMAGE, size: int=3, rank: float=0.5, alpha: bool=False) -> TYPE_IMAGE:
+    """Rank filter over a size x size square: 0 is the minimum, 0.5 the median
+    and 1 the maximum.
 
-    def func_rotate(img: TYPE_IMAGE) -> TYPE_IMAGE:
-        height, width = img.shape[:2]
-        c = (int(width * center[0]), int(height * center[1]))
-        M = cv2.getRotationMatrix2D(c, -angle, 1.0)
-        return cv2.warpAffine(img, M, (width, height), flags=cv2.INTER_LINEAR)
+    Minimum and maximum are rectangular erode/dilate, the uint8 median is
+    cv2.medianBlur and any other rank uses scipy's percentile filter. Takes
+    HxW, HxWxC or a BxHxWxC batch. The alpha of 4 channel input passes through
+    untouched unless alpha is True. Borders replicate the edge pixels.
+    """
+    size = max(1, int(size))
+    if size % 2 == 0:
+        size += 1
+    rank = float(np.clip(rank, 0, 1))
+    if size == 1:
+        return image.copy()
+    if image.ndim == 4:
+        return np.stack([image_rank_filter(i, size, rank, alpha) for i in image])
 
-    image = image_affine_edge(image, func_rotate, edge)
-    return image
+    cc = image.shape[2] if image.ndim == 3 else 1
+    keep = cc == 4 and not alpha
+    src = np.ascontiguousarray(image[..., :3] if keep else image)
+
+    if rank == 0 or rank == 1:
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+        func = cv2.erode if rank == 0 else cv2.dilate
+        out = func(src, kernel, borderType=cv2.BORDER_REPLICATE)
+    elif rank == 0.5 and src.dtype == np.uint8:
+        if src.ndim == 2 or src.shape[2] in [1, 3, 4]:
+            out = cv2.medianBlur(src, size)
+        else:
+            out = cv2.merge([cv2.medianBlur(c, size) for c in cv2.split(src)])
+    else:
+        footprint = (size, size) if src.ndim == 2 else (size, size, 1)
+        out = ndimage.percentile_filter(src, rank * 100, size=footprint, mode='nearest')
+
+    # cv2 drops a trailing single channel
+    out = out.reshape(src.shape)
+    if keep:
+        out = np.dstack([out, image[..., 3]])
+    return out
+
+def image_rotate(image: TYPE_IMAGE, angle: float, center:TYPE_COORD=(0.5, 0.5), edge:EnumEdge=EnumEdge.CLIP) -> TYPE_IMAGE:
+    height, width = image.shape[:2]
+    c = (int(width * center[0]), int(height * center[1]))
+    M = cv2.getRotationMatrix2D(c, -angle, 1.0)
+    return image_warp_affine(image, M, edge=edge)
 
 def image_save_gif(fpath:str, images: List[Image.Image], fps: int=0,
                 loop:int=0, optimize:bool=False) -> None:
@@ -1641,15 +2273,14 @@ def image_save_gif(fpath:str, images: List[Image.Image], fps: int=0,
 
 def image_scale(image: TYPE_IMAGE, scale:TYPE_COORD=(1.0, 1.0), sample:EnumInterpolation=EnumInterpolation.LANCZOS4, edge:EnumEdge=EnumEdge.CLIP) -> TYPE_IMAGE:
 
-    def scale_func(img: TYPE_IMAGE) -> TYPE_IMAGE:
-        height, width = img.shape[:2]
-        width = int(width * scale[0])
-        height = int(height * scale[1])
-        return cv2.resize(img, (width, height), interpolation=sample.value)
-
+    height, width = image.shape[:2]
     if edge == EnumEdge.CLIP:
-        return scale_func(image)
-    return image_affine_edge(image, scale_func, edge)
+        return cv2.resize(image, (int(width * scale[0]), int(height * scale[1])), interpolation=sample.value)
+
+    # wrapped: scale about the center and keep the frame size
+    sX, sY = scale
+    M = np.float64([[sX, 0, (1 - sX) * width / 2], [0, sY, (1 - sY) * height / 2]])
+    return image_warp_affine(image, M, sample=sample, edge=edge)
 
 def image_scalefit(image: TYPE_IMAGE, width: int, height:int,
                 mode:EnumScaleMode=EnumScaleMode.NONE,
@@ -1757,6 +2388,38 @@ def image_stack(image_list: List[TYPE_IMAGE], axis:EnumOrientation=EnumOrientati
             image = np.vstack(images)
     return image
 
+@jit(nopython=True, parallel=True, cache=True)
+def kernel_stereogram(image: TYPE_IMAGE, depth: TYPE_IMAGE, out: TYPE_IMAGE, pattern_width: int,
+                      divisions: int, shift: float) -> None:
+    """Rows are independent; within a row each pixel copies one to its left."""
+    height, width = depth.shape
+    for y in prange(height):
+        for x in range(width):
+            if x < pattern_width:
+                for c in range(3):
+                    out[y, x, c] = image[y, x, c]
+                continue
+            pos = x - pattern_width + int(shift * (depth[y, x] // divisions))
+            # python indexing: negative positions read from the right edge
+            if pos < 0:
+                pos += width
+            if pos < 0 or pos >= width:
+                continue
+            for c in range(3):
+                out[y, x, c] = out[y, pos, c]
+
+@jit(nopython=True, parallel=True, cache=True)
+def kernel_stereo_shift(image: TYPE_IMAGE, deltas: np.ndarray, out: TYPE_IMAGE) -> None:
+    """Move every pixel deltas[y, x] to the right; later pixels in a row win."""
+    height, width = deltas.shape
+    for y in prange(height):
+        for x in range(width):
+            x2 = x + deltas[y, x]
+            if x2 >= width or x2 < 0:
+                continue
+            for c in range(image.shape[2]):
+                out[y, x2, c] = image[y, x, c]
+
 def image_stereogram(image: TYPE_IMAGE, depth: TYPE_IMAGE, divisions:int=8, mix:float=0.33, gamma:float=0.33, shift:float=1.) -> TYPE_IMAGE:
     height, width = depth.shape[:2]
     out = np.zeros((height, width, 3), dtype=np.uint8)
@@ -1768,43 +2431,24 @@ def image_stereogram(image: TYPE_IMAGE, depth: TYPE_IMAGE, divisions:int=8, mix:
     image = cv2.addWeighted(image, 1. - mix, noise, mix, 0)
 
     pattern_width = width // divisions
-    # shift -= 1
-    for y in range(height):
-        for x in range(width):
-            if x < pattern_width:
-                out[y, x] = image[y, x]
-            else:
-                # out[y, x] = out[y, x - pattern_width + int(shift * invert)]
-                offset = depth[y, x][0] // divisions
-                pos = x - pattern_width + int(shift * offset)
-                # pos = max(-pattern_width, min(pattern_width, pos))
-                out[y, x] = out[y, pos]
+    depth = np.ascontiguousarray(depth[..., 0])
+    kernel_stereogram(np.ascontiguousarray(image), depth, out, pattern_width, divisions, float(shift))
     return out
 
 def image_stereo_shift(image: TYPE_IMAGE, depth: TYPE_IMAGE, shift:float=10) -> TYPE_IMAGE:
     # Ensure base image has alpha
     image = image_convert(image, 4)
     depth = image_convert(depth, 1)
-    deltas = np.array((depth / 255.0) * float(shift), dtype=int)
+    if depth.ndim == 3:
+        depth = depth[..., 0]
+    deltas = np.array((depth / 255.0) * float(shift), dtype=np.int64)
     shifted_data = np.zeros_like(image)
-    _, width = image.shape[:2]
-    for y, row in enumerate(deltas):
-        for x, dx in enumerate(row):
-            x2 = x + dx
-            if (x2 >= width) or (x2 < 0):
-                continue
-            shifted_data[y][x2] = image[y][x]
-
-    shifted_image = cv2pil(shifted_data)
-    alphas_image = Image.fromarray(
-        ndimage.binary_fill_holes(
-            ImageChops.invert(
-                shifted_image.getchannel("A")
-            )
-        )
-    ).convert("1")
-    shifted_image.putalpha(ImageChops.invert(alphas_image))
-    return pil2cv(shifted_image)
+    kernel_stereo_shift(np.ascontiguousarray(image), deltas, shifted_data)
+
+    # pixels nothing landed on, and any enclosed by them, go transparent
+    holes = ndimage.binary_fill_holes(shifted_data[..., 3] != 255)
+    shifted_data[..., 3] = np.where(holes, 0, 255).astype(np.uint8)
+    return shifted_data
 
 def image_threshold(image:TYPE_IMAGE, threshold:float=0.5,
                     mode:EnumThreshold=EnumThreshold.BINARY,
@@ -1838,36 +2482,67 @@ def image_translate(image: TYPE_IMAGE, offset: TYPE_COORD = (0.0, 0.0), edge: En
         TYPE_IMAGE: Translated image.
     """
 
-    def translate(img: TYPE_IMAGE) -> TYPE_IMAGE:
-        height, width = img.shape[:2]
-        scalarX = 0.333 if edge in [EnumEdge.WRAP, EnumEdge.WRAPX] else 1.0
-        scalarY = 0.333 if edge in [EnumEdge.WRAP, EnumEdge.WRAPY] else 1.0
+    height, width = image.shape[:2]
+    scalarX = 0.333 if edge in [EnumEdge.WRAP, EnumEdge.WRAPX] else 1.0
+    scalarY = 0.333 if edge in [EnumEdge.WRAP, EnumEdge.WRAPY] else 1.0
+    M = np.float64([[1, 0, offset[0] * width * scalarX], [0, 1, offset[1] * height * scalarY]])
+    return image_warp_affine(image, M, edge=edge, border_value=border_value)
+
+@functools.lru_cache(maxsize=256)
+def image_transform_matrix(width: int, height: int, angle: float=0, scale: Tuple[float, float]=(1.0, 1.0),
+                           edge: EnumEdge=EnumEdge.CLIP) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Flip, scale and rotate of image_transform as one 3x3 matrix, and the
+    output size.
+
+    Offsets are left out: they only add to the last column, so a batch that
+    only moves reuses the cached matrix.
+    """
+    sX, sY = scale
+    M = np.eye(3)
+    if sX < 0:
+        M = np.float64([[-1, 0, width - 1], [0, 1, 0], [0, 0, 1]]) @ M
+        sX = -sX
+    if sY < 0:
+        M = np.float64([[1, 0, 0], [0, -1, height - 1], [0, 0, 1]]) @ M
+        sY = -sY
 
-        M = np.float32([[1, 0, offset[0] * width * scalarX], [0, 1, offset[1] * height * scalarY]])
+    W, H = width, height
+    if sX != 1. or sY != 1.:
         if edge == EnumEdge.CLIP:
-            border_mode = cv2.BORDER_CONSTANT
+            # resize to the scaled size, pixel centers aligned as cv2.resize does
+            W, H = max(1, int(width * sX)), max(1, int(height * sY))
+            fx, fy = W / width, H / height
+            S = np.float64([[fx, 0, 0.5 * fx - 0.5], [0, fy, 0.5 * fy - 0.5], [0, 0, 1]])
         else:
-            border_mode = cv2.BORDER_WRAP
+            S = np.float64([[sX, 0, (1 - sX) * W / 2], [0, sY, (1 - sY) * H / 2], [0, 0, 1]])
+        M = S @ M
 
-        return cv2.warpAffine(img, M, (width, height), flags=cv2.INTER_LINEAR, borderMode=border_mode, borderValue=border_value)
+    if angle != 0:
+        R = np.vstack([cv2.getRotationMatrix2D((int(W * 0.5), int(H * 0.5)), -angle, 1.0), [0, 0, 1]])
+        M = R @ M
 
-    return translate(image)
+    M.setflags(write=False)
+    return M, (W, H)
 
 def image_transform(image: TYPE_IMAGE, offset:TYPE_COORD=(0.0, 0.0), angle:float=0, scale:TYPE_COORD=(1.0, 1.0), sample:EnumInterpolation=EnumInterpolation.LANCZOS4, edge:EnumEdge=EnumEdge.CLIP) -> TYPE_IMAGE:
+    """Scale, rotate and translate (in that order) with a single warp."""
+    height, width = image.shape[:2]
     sX, sY = scale
-    if sX < 0:
-        image = cv2.flip(image, 1)
-        sX = -sX
-    if sY < 0:
-        image = cv2.flip(image, 0)
-        sY = -sY
-    if sX != 1. or sY != 1.:
-        image = image_scale(image, (sX, sY), sample, edge)
-    if angle != 0:
-        image = image_rotate(image, angle, edge=edge)
-    if offset[0] != 0. or offset[1] != 0.:
-        image = image_translate(image, offset, edge)
-    return image
+    M, (W, H) = image_transform_matrix(width, height, float(angle), (float(sX), float(sY)), edge)
+
+    if angle == 0 and abs(sX) == 1 and abs(sY) == 1 and offset[0] == 0 and offset[1] == 0:
+        if sX < 0:
+            image = cv2.flip(image, 1)
+        if sY < 0:
+            image = cv2.flip(image, 0)
+        return image
+
+    scalarX = 0.333 if edge in [EnumEdge.WRAP, EnumEdge.WRAPX] else 1.0
+    scalarY = 0.333 if edge in [EnumEdge.WRAP, EnumEdge.WRAPY] else 1.0
+    M = M[:2].copy()
+    M[0, 2] += offset[0] * W * scalarX
+    M[1, 2] += offset[1] * H * scalarY
+    return image_warp_affine(image, M, (W, H), sample, edge)
 
 # MORPHOLOGY
 
@@ -1894,24 +2569,11 @@ def morph_emboss(image: TYPE_IMAGE, amount: float=1., kernel: int=2) -> TYPE_IMA
 # KERNELS
 
 def MEDIAN3x3(image: TYPE_IMAGE) -> TYPE_IMAGE:
+    """3x3 median of a single channel image into float64, zero on the border."""
     height, width = image.shape[:2]
     out = np.zeros([height, width])
-    for i in range(1, height-1):
-        for j in range(1, width-1):
-            temp = [
-                image[i-1, j-1],
-                image[i-1, j],
-                image[i-1, j + 1],
-                image[i, j-1],
-                image[i, j],
-                image[i, j + 1],
-                image[i + 1, j-1],
-                image[i + 1, j],
-                image[i + 1, j + 1]
-            ]
-
-            temp = sorted(temp)
-            out[i, j]= temp[4]
+    if height > 2 and width > 2:
+        out[1:-1, 1:-1] = image_rank_filter(image, 3, 0.5)[1:-1, 1:-1]
     return out
 
 def kernel(stride: int) -> TYPE_IMAGE:
@@ -1954,13 +2616,10 @@ def color_image2lut(image: TYPE_IMAGE, num_colors:int=256) -> np.ndarray[np.uint
     """Create X sized LUT from an RGB image."""
     image = image_convert(image, 3)
     lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-    pixels = lab.reshape(-1, 3)
-    kmeans = MiniBatchKMeans(n_clusters=num_colors)
-    kmeans.fit(pixels)
-    colors = kmeans.cluster_centers_.astype(np.uint8)
+    colors = PaletteExtractor().palette(lab.reshape(-1, 3), num_colors).astype(np.uint8)
     lut = np.zeros((256, 1, 3), dtype=np.uint8)
-    for i, color in enumerate(colors):
-        lut[i] = color
+    colors = colors[:256]
+    lut[:len(colors), 0] = colors
     return lut
 
 def color_match_histogram(image: TYPE_IMAGE, usermap: TYPE_IMAGE) -> TYPE_IMAGE:
@@ -2177,6 +2836,30 @@ def coord_perspective(width: int, height: int, pts: List[TYPE_COORD]) -> TYPE_IM
     pts = np.column_stack([pts[:, 0], pts[:, 1]])
     return cv2.getPerspectiveTransform(object_pts, pts)
 
+def coord_perspective_map(width: int, height: int, matrix: np.ndarray) -> Tuple[TYPE_IMAGE, TYPE_IMAGE]:
+    """Source x & y of every output pixel for warpPerspective(matrix)."""
+    inv = np.linalg.inv(matrix)
+    x, y = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+    w = inv[2, 0] * x + inv[2, 1] * y + inv[2, 2]
+    w = np.where(w == 0, np.finfo(np.float64).eps, w)
+    map_x = (inv[0, 0] * x + inv[0, 1] * y + inv[0, 2]) / w
+    map_y = (inv[1, 0] * x + inv[1, 1] * y + inv[1, 2]) / w
+    return map_x.astype(np.float32), map_y.astype(np.float32)
+
+def coord_polar(width: int, height: int, center: TYPE_COORD, radius: float, wrap: int=0) -> Tuple[TYPE_IMAGE, TYPE_IMAGE]:
+    """Source x & y of every output pixel for cv2.linearPolar(WARP_INVERSE_MAP):
+    radius along x, angle along y.
+
+    wrap offsets y for a source padded with that many wrapped rows on top and
+    bottom, so angles just under 2pi read row 0 instead of the border.
+    """
+    x, y = coord_default(width, height, center)
+    r, theta = coord_cart2polar(x.astype(np.float64), y.astype(np.float64))
+    theta = np.where(theta < 0, theta + TAU, theta)
+    map_x = r * (width / radius)
+    map_y = theta * (height / TAU) + wrap
+    return map_x.astype(np.float32), map_y.astype(np.float32)
+
 def coord_sphere(width: int, height: int, radius: float) -> Tuple[TYPE_IMAGE, TYPE_IMAGE]:
     theta, phi = np.meshgrid(np.linspace(0, TAU, width), np.linspace(0, np.pi, height))
     x = radius * np.sin(phi) * np.cos(theta)
@@ -2191,8 +2874,10 @@ def remap_fisheye(image: TYPE_IMAGE, distort: float) -> TYPE_IMAGE:
     height, width = image.shape[:2]
     if cc == 1:
         image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-    map_x, map_y = coord_fisheye(width, height, distort)
-    image = cv2.remap(image, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+    distort = float(distort)
+    map1, map2 = RemapCache().get(('fisheye', width, height, distort),
+                                  lambda: coord_fisheye(width, height, distort))
+    image = cv2.remap(image, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
     #if cc == 1:
     #    image = image[..., 0]
     return image
@@ -2202,8 +2887,10 @@ def remap_perspective(image: TYPE_IMAGE, pts: list) -> TYPE_IMAGE:
     height, width = image.shape[:2]
     if cc == 1:
         image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-    pts = coord_perspective(width, height, pts)
-    image = cv2.warpPerspective(image, pts, (width, height))
+    pts = tuple((float(x), float(y)) for x, y in pts)
+    map1, map2 = RemapCache().get(('perspective', width, height, pts),
+                                  lambda: coord_perspective_map(width, height, coord_perspective(width, height, pts)))
+    image = cv2.remap(image, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
     #if cc == 1:
     #    image = image[..., 0]
     return image
@@ -2213,12 +2900,20 @@ def remap_polar(image: TYPE_IMAGE) -> TYPE_IMAGE:
     "origin" is a tuple of (x0, y0) and defaults to the center of the image."""
     h, w = image.shape[:2]
     radius = max(w, h)
-    return cv2.linearPolar(image, (h // 2, w // 2), radius // 2, cv2.WARP_INVERSE_MAP)
+    # same center and radius as the cv2.linearPolar call this replaces
+    center, radius = (h // 2, w // 2), max(1, radius // 2)
+    map1, map2 = RemapCache().get(('polar', w, h, center, radius),
+                                  lambda: coord_polar(w, h, center, radius, 1), nearest=True)
+    # the angle runs down the rows: wrap one row each way, as linearPolar does
+    image = cv2.copyMakeBorder(image, 1, 1, 0, 0, cv2.BORDER_WRAP)
+    return cv2.remap(image, map1, map2, interpolation=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT)
 
 def remap_sphere(image: TYPE_IMAGE, radius: float) -> TYPE_IMAGE:
     height, width = image.shape[:2]
-    map_x, map_y = coord_sphere(width, height, radius)
-    return cv2.remap(image, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+    radius = float(radius)
+    map1, map2 = RemapCache().get(('sphere', width, height, radius),
+                                  lambda: coord_sphere(width, height, radius))
+    return cv2.remap(image, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
 
 def depth_from_gradient(grad_x, grad_y):
     """Optimized Frankot-Chellappa depth-from-gradient algorithm."""
@@ -5,16 +5,53 @@ GLSL Support
 Blended from old ModernGL implementation + Audio_Scheduler & Fill Node Pack
 """
 
+import os
 import re
-from typing import Any, Dict, Tuple, Optional, List
+import sys
+import time
+import queue
+import atexit
+import ctypes
+import hashlib
+import weakref
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple, Optional, List
 
-import cv2
-import glfw
 import numpy as np
-import OpenGL.GL as gl
 
 from loguru import logger
 
+# =============================================================================
+
+# glfw needs a display; EGL and OSMesa render headless. The backend is only
+# handed to PyOpenGL by gl_load(), when the first context is created, so
+# importing this module leaves the rest of the process alone.
+JOV_GL_BACKEND = os.getenv("JOV_GL_BACKEND", "").strip().lower()
+if JOV_GL_BACKEND not in ('', 'glfw', 'egl', 'osmesa'):
+    logger.warning(f"unknown JOV_GL_BACKEND {JOV_GL_BACKEND}")
+    JOV_GL_BACKEND = ''
+
+if JOV_GL_BACKEND == '':
+    JOV_GL_BACKEND = os.getenv("PYOPENGL_PLATFORM", "").strip().lower()
+    if JOV_GL_BACKEND not in ('egl', 'osmesa'):
+        JOV_GL_BACKEND = 'glfw'
+        if sys.platform.startswith('linux') and not (os.getenv("DISPLAY") or os.getenv("WAYLAND_DISPLAY")):
+            JOV_GL_BACKEND = 'egl'
+
+# OpenGL.GL once gl_load() has run
+gl = None
+
+try:
+    import glfw
+except Exception as e:
+    glfw = None
+    if JOV_GL_BACKEND == 'glfw':
+        logger.error(str(e))
+
+from Jovimetrix import ROOT, Singleton
 from Jovimetrix.sup.util import EnumConvertType, load_file, parse_value
 from Jovimetrix.sup.image import image_convert
 
@@ -24,15 +61,35 @@ IMAGE_SIZE_DEFAULT = 512
 IMAGE_SIZE_MIN = 64
 IMAGE_SIZE_MAX = 16384
 
+# linked programs nobody references, kept around for the next instance
+JOV_GLSL_PROGRAM_IDLE = 32
+try:
+    JOV_GLSL_PROGRAM_IDLE = max(0, int(os.getenv("JOV_GLSL_PROGRAM_IDLE", JOV_GLSL_PROGRAM_IDLE)))
+except Exception as e:
+    logger.error(str(e))
+
+# accelerated image ops: smallest input (pixels) worth considering for GL,
+# calls between re-measuring both paths, mean abs difference (0-255) allowed
+JOV_GLSL_ACCEL_MIN = 1 << 20
+JOV_GLSL_ACCEL_PROBE = 256
+JOV_GLSL_ACCEL_TOLERANCE = 1.
+try:
+    JOV_GLSL_ACCEL_MIN = max(0, int(os.getenv("JOV_GLSL_ACCEL_MIN", JOV_GLSL_ACCEL_MIN)))
+    JOV_GLSL_ACCEL_PROBE = max(1, int(os.getenv("JOV_GLSL_ACCEL_PROBE", JOV_GLSL_ACCEL_PROBE)))
+    JOV_GLSL_ACCEL_TOLERANCE = max(0., float(os.getenv("JOV_GLSL_ACCEL_TOLERANCE", JOV_GLSL_ACCEL_TOLERANCE)))
+except Exception as e:
+    logger.error(str(e))
+
+# OpenGL.GL entry point per uniform type
 LAMBDA_UNIFORM = {
-    'int': gl.glUniform1i,
-    'ivec2': gl.glUniform2i,
-    'ivec3': gl.glUniform3i,
-    'ivec4': gl.glUniform4i,
-    'float': gl.glUniform1f,
-    'vec2': gl.glUniform2f,
-    'vec3': gl.glUniform3f,
-    'vec4': gl.glUniform4f,
+    'int': 'glUniform1i',
+    'ivec2': 'glUniform2i',
+    'ivec3': 'glUniform3i',
+    'ivec4': 'glUniform4i',
+    'float': 'glUniform1f',
+    'vec2': 'glUniform2f',
+    'vec3': 'glUniform3f',
+    'vec4': 'glUniform4f',
 }
 
 PTYPE = {
@@ -51,11 +108,660 @@ RE_VARIABLE = re.compile(r"uniform\s+(\w+)\s+(\w+);(?:\s*\/\/\s*([0-9.,\s]*))?\s
 
 RE_SHADER_META = re.compile(r"\/{2}\s?([A-Za-z_]{3,}):\s?([A-Za-z_0-9\s\-()[\]]+)$", re.MULTILINE)
 
+RE_SHADER_PASS = re.compile(r"^\/{2}\s?pass:\s?(\w+)\s*$", re.MULTILINE)
+
 # =============================================================================
 
 class CompileException(Exception): pass
 
+# kept in place of a value that may change in place, matches nothing
+UNIFORM_MUTABLE = object()
+
+def uniform_frozen(val:Any) -> bool:
+    """True for values that cannot change in place: None, scalars, strings
+    and tuples of scalars."""
+    if val is None or isinstance(val, (int, float, str, np.generic)):
+        return True
+    return isinstance(val, tuple) and all(isinstance(v, (int, float, np.generic)) for v in val)
+
+def uniform_setter(p_type:str, loc:int, state:Dict[int, Any]) -> Callable[[Any], None]:
+    """Bind the GL call, the converter and the location for one uniform.
+
+    The setter skips the GL call when the converted value matches the last
+    one sent to that location. A value that cannot change in place skips the
+    conversion too when it is the same object as last time; lists and arrays
+    are always converted, since the caller may have edited them since.
+    """
+    func = getattr(gl, LAMBDA_UNIFORM[p_type])
+    ptype = PTYPE[p_type]
+    size = int(p_type[-1]) if p_type[-1].isdigit() else 1
+    cast = int if p_type.startswith('i') else float
+
+    def setter(val:Any) -> None:
+        last = state.get(loc, None)
+        # only frozen values are kept, so the same object is the same value
+        if last is not None and last[0] is val:
+            return
+        src = val.ravel().tolist() if isinstance(val, np.ndarray) else val
+        if size == 1 and isinstance(src, (int, float)):
+            data = (cast(src),)
+        elif isinstance(src, (list, tuple)) and len(src) == size and all(isinstance(v, (int, float)) for v in src):
+            data = tuple(cast(v) for v in src)
+        else:
+            data = parse_value(src.split(',') if isinstance(src, str) else src, ptype, 0)
+            data = tuple(data) if isinstance(data, (list, tuple)) else (data,)
+        state[loc] = (val if uniform_frozen(val) else UNIFORM_MUTABLE, data)
+        if last is None or last[1] != data:
+            func(loc, *data)
+    return setter
+
+class GLContext:
+    """An offscreen GL context. Rendering always goes through FBOs, so the
+    backend only has to provide something current to draw with.
+
+    Contexts are only used on the GL worker, so making one current is
+    skipped when it already is, and counted when it is not."""
+    CURRENT: Optional['GLContext'] = None
+    SWITCHES = 0
+
+    def make_current(self) -> None:
+        if GLContext.CURRENT is self:
+            return
+        self._make_current()
+        GLContext.CURRENT = self
+        GLContext.SWITCHES += 1
+
+    def _make_current(self) -> None:
+        raise NotImplementedError
+
+    def poll(self) -> None:
+        pass
+
+    def release(self) -> None:
+        if GLContext.CURRENT is self:
+            GLContext.CURRENT = None
+
+    def __del__(self) -> None:
+        self.release()
+
+class GLContextGLFW(GLContext):
+    def __init__(self, share:Optional['GLContextGLFW']=None) -> None:
+        if glfw is None or not glfw.init():
+            raise RuntimeError("GLFW did not init")
+        glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+        self.__window = glfw.create_window(IMAGE_SIZE_MIN, IMAGE_SIZE_MIN, "hidden", None,
+                                           share.window if share is not None else None)
+        if not self.__window:
+            raise RuntimeError("GLFW did not init window")
+
+    @property
+    def window(self) -> Any:
+        return self.__window
+
+    def _make_current(self) -> None:
+        glfw.make_context_current(self.__window)
+
+    def poll(self) -> None:
+        glfw.poll_events()
+
+    def release(self) -> None:
+        super().release()
+        if getattr(self, '_GLContextGLFW__window', None):
+            glfw.destroy_window(self.__window)
+            self.__window = None
+
+class GLContextEGL(GLContext):
+    """Surfaceless (or 1x1 pbuffer) EGL context with a 3.3+ core profile."""
+    DISPLAY = None
+
+    def __init__(self, share:Optional['GLContextEGL']=None) -> None:
+        from OpenGL import EGL
+        self.__egl = EGL
+        if GLContextEGL.DISPLAY is None:
+            display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+            major, minor = EGL.EGLint(), EGL.EGLint()
+            if not display or not EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor)):
+                raise RuntimeError("EGL did not init")
+            logger.debug(f"EGL {major.value}.{minor.value}")
+            GLContextEGL.DISPLAY = display
+        self.__display = GLContextEGL.DISPLAY
+
+        attribs = [
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8,
+            EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE
+        ]
+        attribs = (EGL.EGLint * len(attribs))(*attribs)
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.__display, attribs, ctypes.pointer(config), 1, ctypes.pointer(count)) or count.value < 1:
+            raise RuntimeError("EGL has no usable config")
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+
+        attribs = [
+            EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+            EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+            EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+            EGL.EGL_NONE
+        ]
+        attribs = (EGL.EGLint * len(attribs))(*attribs)
+        other = share.context if share is not None else EGL.EGL_NO_CONTEXT
+        self.__context = EGL.eglCreateContext(self.__display, config, other, attribs)
+        if not self.__context:
+            raise RuntimeError("EGL did not create a context")
+
+        attribs = [EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE]
+        attribs = (EGL.EGLint * len(attribs))(*attribs)
+        self.__surface = EGL.eglCreatePbufferSurface(self.__display, config, attribs)
+        if not self.__surface:
+            # EGL_KHR_surfaceless_context
+            self.__surface = None
+
+    @property
+    def context(self) -> Any:
+        return self.__context
+
+    def _make_current(self) -> None:
+        surface = self.__surface if self.__surface is not None else self.__egl.EGL_NO_SURFACE
+        if not self.__egl.eglMakeCurrent(self.__display, surface, surface, self.__context):
+            raise RuntimeError("EGL could not make context current")
+
+    def release(self) -> None:
+        super().release()
+        if getattr(self, '_GLContextEGL__context', None) is None:
+            return
+        EGL = self.__egl
+        EGL.eglMakeCurrent(self.__display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        if self.__surface is not None:
+            EGL.eglDestroySurface(self.__display, self.__surface)
+        EGL.eglDestroyContext(self.__display, self.__context)
+        self.__context = None
+
+class GLContextOSMesa(GLContext):
+    """Software OSMesa context with a 3.3+ core profile."""
+    def __init__(self, share:Optional['GLContextOSMesa']=None) -> None:
+        from OpenGL import osmesa, arrays
+        self.__osmesa = osmesa
+        attribs = [
+            osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+            osmesa.OSMESA_DEPTH_BITS, 24,
+            osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+            osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3,
+            osmesa.OSMESA_CONTEXT_MINOR_VERSION, 3,
+            0
+        ]
+        other = share.context if share is not None else None
+        self.__context = osmesa.OSMesaCreateContextAttribs(attribs, other)
+        if not self.__context:
+            raise RuntimeError("OSMesa did not create a context")
+        # the default framebuffer is never drawn to
+        self.__buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+
+    @property
+    def context(self) -> Any:
+        return self.__context
+
+    def _make_current(self) -> None:
+        if not self.__osmesa.OSMesaMakeCurrent(self.__context, self.__buffer, gl.GL_UNSIGNED_BYTE, 1, 1):
+            raise RuntimeError("OSMesa could not make context current")
+
+    def release(self) -> None:
+        super().release()
+        if getattr(self, '_GLContextOSMesa__context', None) is None:
+            return
+        self.__osmesa.OSMesaDestroyContext(self.__context)
+        self.__context = None
+
+GL_BACKEND = {
+    'glfw': GLContextGLFW,
+    'egl': GLContextEGL,
+    'osmesa': GLContextOSMesa,
+}
+
+GL_SHARE_ROOT: Optional[GLContext] = None
+
+def gl_load() -> None:
+    """Import OpenGL.GL bound to JOV_GL_BACKEND.
+
+    PyOpenGL picks its platform from PYOPENGL_PLATFORM on first import. The
+    variable is set for that import only and then put back, so other
+    packages and child processes never see it.
+    """
+    global gl
+    if gl is not None:
+        return
+    if JOV_GL_BACKEND != 'glfw':
+        if 'OpenGL.platform' in sys.modules and os.getenv("PYOPENGL_PLATFORM", "").lower() != JOV_GL_BACKEND:
+            logger.warning(f"OpenGL already loaded; {JOV_GL_BACKEND} backend may not bind")
+        if JOV_GL_BACKEND == 'egl':
+            # lets Mesa pick a display without X or Wayland
+            os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+    platform = os.environ.get('PYOPENGL_PLATFORM', None)
+    try:
+        if JOV_GL_BACKEND != 'glfw':
+            os.environ['PYOPENGL_PLATFORM'] = JOV_GL_BACKEND
+        import OpenGL.GL
+    finally:
+        if platform is None:
+            os.environ.pop('PYOPENGL_PLATFORM', None)
+        else:
+            os.environ['PYOPENGL_PLATFORM'] = platform
+    gl = OpenGL.GL
+    logger.info(f"GL backend: {JOV_GL_BACKEND}")
+
+def gl_share_root() -> GLContext:
+    """The context every shader renders with.
+
+    GL only runs on the worker thread, so one context serves every shader
+    and rendering one after another never switches contexts. Shaders keep
+    their own VAO, targets and textures and bind them for each render.
+    Programs are keyed by this context's share group."""
+    global GL_SHARE_ROOT
+    if GL_SHARE_ROOT is None:
+        gl_load()
+        GL_SHARE_ROOT = GL_BACKEND[JOV_GL_BACKEND]()
+    return GL_SHARE_ROOT
+
+class GLWorker(metaclass=Singleton):
+    """The one thread that talks to GL.
+
+    Every context is created, made current and destroyed here, so a context
+    never migrates between threads. Jobs are submitted as callables and come
+    back as futures; call() runs inline when already on the worker. Every
+    shader shares the one root context (see gl_share_root).
+
+    At interpreter exit the queue is drained, tracked objects are released,
+    then the root context is destroyed, all on this thread.
+    """
+    def __init__(self) -> None:
+        self.__queue: queue.Queue = queue.Queue()
+        self.__tracked = weakref.WeakSet()
+        self.__lock = threading.Lock()
+        self.__stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'peak': 0, 'busy': 0.}
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name="jovi-gl", daemon=True)
+        self.__thread.start()
+        atexit.register(self.shutdown)
+
+    def __run(self) -> None:
+        while True:
+            job = self.__queue.get()
+            if job is None:
+                break
+            future, func, arg, kw = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.perf_counter()
+            try:
+                future.set_result(func(*arg, **kw))
+                key = 'completed'
+            except BaseException as e:
+                future.set_exception(e)
+                key = 'failed'
+            with self.__lock:
+                self.__stats[key] += 1
+                self.__stats['busy'] += time.perf_counter() - start
+        self.__release_all()
+
+    def __release_all(self) -> None:
+        for obj in list(self.__tracked):
+            try:
+                obj.release()
+            except Exception as e:
+                logger.error(str(e))
+        global GL_SHARE_ROOT
+        if GL_SHARE_ROOT is not None:
+            GL_SHARE_ROOT.release()
+            GL_SHARE_ROOT = None
+        if JOV_GL_BACKEND == 'glfw' and glfw is not None:
+            glfw.terminate()
+        logger.debug("GL worker stopped")
+
+    @property
+    def on_thread(self) -> bool:
+        return threading.current_thread() is self.__thread
+
+    @property
+    def depth(self) -> int:
+        return self.__queue.qsize()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            return dict(self.__stats, depth=self.__queue.qsize(), switches=GLContext.SWITCHES)
+
+    def submit(self, func:Callable, *arg, **kw) -> Future:
+        future = Future()
+        if not self.__running:
+            future.set_exception(RuntimeError("GL worker is shut down"))
+            return future
+        self.__queue.put((future, func, arg, kw))
+        with self.__lock:
+            self.__stats['submitted'] += 1
+            self.__stats['peak'] = max(self.__stats['peak'], self.__queue.qsize())
+        return future
+
+    def call(self, func:Callable, *arg, **kw) -> Any:
+        if self.on_thread:
+            return func(*arg, **kw)
+        return self.submit(func, *arg, **kw).result()
+
+    def track(self, obj:Any) -> None:
+        """Release obj (anything with a release() method) at shutdown."""
+        self.__tracked.add(obj)
+
+    def context(self) -> GLContext:
+        """The shared render context. Worker thread only."""
+        return gl_share_root()
+
+    def shutdown(self, wait:bool=True) -> None:
+        if not self.__running:
+            return
+        self.__running = False
+        self.__queue.put(None)
+        if wait and not self.on_thread:
+            self.__thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self.__running
+
+def gl_call(func:Callable) -> Callable:
+    """Run the wrapped method on the GL worker thread."""
+    @functools.wraps(func)
+    def wrapper(*arg, **kw) -> Any:
+        return GLWorker().call(func, *arg, **kw)
+    return wrapper
+
+class GLSLProgramCache(metaclass=Singleton):
+    """Process-wide linked programs, keyed by share group and a hash of the
+    final vertex and fragment source.
+
+    Programs are refcounted; unreferenced ones stay in a small idle list
+    before they are deleted. Failed compiles are remembered by source hash
+    and raise again without touching the driver.
+    """
+    def __init__(self) -> None:
+        self.__lock = threading.RLock()
+        self.__programs: Dict[Tuple[int, str], List[int]] = {}
+        self.__idle: OrderedDict[Tuple[int, str], int] = OrderedDict()
+        self.__errors: Dict[str, str] = {}
+        # last value sent per uniform location; uniforms are program state
+        # so this is shared by every shader using the program
+        self.__state: Dict[int, Dict[int, Any]] = {}
+        self.__stats = {'compile': 0, 'hit': 0, 'error': 0}
+
+    @staticmethod
+    def digest(vertex:str, fragment:str) -> str:
+        return hashlib.sha1(f"{vertex}\0{fragment}".encode()).hexdigest()
+
+    @staticmethod
+    def __compile(source:str, shader_type:int) -> int:
+        shader = gl.glCreateShader(shader_type)
+        gl.glShaderSource(shader, source)
+        gl.glCompileShader(shader)
+        if gl.glGetShaderiv(shader, gl.GL_COMPILE_STATUS) != gl.GL_TRUE:
+            log = gl.glGetShaderInfoLog(shader).decode()
+            gl.glDeleteShader(shader)
+            logger.error(f"Shader compilation error: {log}")
+            raise CompileException(log)
+        return shader
+
+    def __link(self, vertex:str, fragment:str) -> int:
+        start = time.perf_counter()
+        shaders = []
+        try:
+            shaders.append(self.__compile(vertex, gl.GL_VERTEX_SHADER))
+            shaders.append(self.__compile(fragment, gl.GL_FRAGMENT_SHADER))
+            compiled = time.perf_counter()
+            program = gl.glCreateProgram()
+            for shader in shaders:
+                gl.glAttachShader(program, shader)
+            gl.glLinkProgram(program)
+            if gl.glGetProgramiv(program, gl.GL_LINK_STATUS) != gl.GL_TRUE:
+                log = gl.glGetProgramInfoLog(program).decode()
+                gl.glDeleteProgram(program)
+                logger.error(f"Program linking error: {log}")
+                raise CompileException(log)
+        finally:
+            for shader in shaders:
+                gl.glDeleteShader(shader)
+        done = time.perf_counter()
+        logger.info(f"program compiled in {(compiled - start) * 1000:.1f}ms, linked in {(done - compiled) * 1000:.1f}ms")
+        return program
+
+    def acquire(self, group:int, vertex:str, fragment:str) -> Tuple[str, int]:
+        """Return (digest, program) for the sources, compiling on a miss.
+
+        A context from `group` must be current. Raises CompileException for
+        sources that failed before or fail now.
+        """
+        digest = self.digest(vertex, fragment)
+        key = (group, digest)
+        with self.__lock:
+            if (log := self.__errors.get(digest, None)) is not None:
+                self.__stats['error'] += 1
+                raise CompileException(log)
+
+            if (entry := self.__programs.get(key, None)) is not None:
+                entry[1] += 1
+                self.__stats['hit'] += 1
+                return digest, entry[0]
+
+            if (program := self.__idle.pop(key, None)) is None:
+                try:
+                    program = self.__link(vertex, fragment)
+                except CompileException as e:
+                    self.__errors[digest] = str(e)
+                    self.__stats['error'] += 1
+                    raise
+                self.__stats['compile'] += 1
+            else:
+                self.__stats['hit'] += 1
+            self.__programs[key] = [program, 1]
+            return digest, program
+
+    def release(self, group:int, digest:str) -> None:
+        """Drop one reference. A context from `group` must be current."""
+        key = (group, digest)
+        with self.__lock:
+            if (entry := self.__programs.get(key, None)) is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            self.__programs.pop(key)
+            self.__idle[key] = entry[0]
+            while len(self.__idle) > JOV_GLSL_PROGRAM_IDLE:
+                _, program = self.__idle.popitem(last=False)
+                self.__state.pop(program, None)
+                gl.glDeleteProgram(program)
+
+    def state(self, program:int) -> Dict[int, Any]:
+        """Last values sent to each uniform location of a program."""
+        with self.__lock:
+            return self.__state.setdefault(program, {})
+
+    def forget_errors(self) -> None:
+        with self.__lock:
+            self.__errors = {}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__stats, live=len(self.__programs), idle=len(self.__idle))
+
+class GLSLPassBuffer:
+    """Two textures a pass alternates between, so it (or any other pass) can
+    sample its last output while the next one is written.
+
+    Allocation leaves the active unit's 2D binding, the framebuffer and the
+    clear colour as it found them."""
+    def __init__(self, width:int, height:int, rgba8:bool=False) -> None:
+        bound = gl.glGetIntegerv(gl.GL_TEXTURE_BINDING_2D)
+        fbo_bound = gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING)
+        clear = gl.glGetFloatv(gl.GL_COLOR_CLEAR_VALUE)
+        self.__fbo: List[int] = list(gl.glGenFramebuffers(2))
+        self.__texture: List[int] = list(gl.glGenTextures(2))
+        # feedback starts from transparent black, not undefined memory
+        gl.glClearColor(0, 0, 0, 0)
+        for fbo, texture in zip(self.__fbo, self.__texture):
+            gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+            if rgba8:
+                gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+            else:
+                gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA32F, width, height, 0, gl.GL_RGBA, gl.GL_FLOAT, None)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, fbo)
+            gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D, texture, 0)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        gl.glClearColor(*clear)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, fbo_bound)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, bound)
+        self.__front = 0
+
+    @property
+    def texture(self) -> int:
+        """The last completed output."""
+        return self.__texture[self.__front]
+
+    @property
+    def front(self) -> int:
+        """FBO holding the last completed output."""
+        return self.__fbo[self.__front]
+
+    @property
+    def back(self) -> int:
+        """FBO to draw the next output into."""
+        return self.__fbo[1 - self.__front]
+
+    def swap(self) -> None:
+        self.__front = 1 - self.__front
+
+    def release(self) -> None:
+        gl.glDeleteTextures(2, self.__texture)
+        gl.glDeleteFramebuffers(2, self.__fbo)
+
+class GLSLRenderTarget:
+    """Render FBO, flipped RGBA8 resolve FBO and a PBO pair for one size and
+    format, plus the pass buffers used at that size. Created and used with
+    its owner's context current."""
+    def __init__(self, width:int, height:int, rgba8:bool=False) -> None:
+        self.__size = (width, height)
+        self.__rgba8 = rgba8
+        self.__buffers: Dict[str, GLSLPassBuffer] = {}
+
+        # render target the program draws into
+        self.__fbo = gl.glGenFramebuffers(1)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
+        self.__texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.__texture)
+        if rgba8:
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+        else:
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA32F, width, height, 0, gl.GL_RGBA, gl.GL_FLOAT, None)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+        gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D, self.__texture, 0)
+
+        # RGBA8 resolve target -- the blit into it flips rows so the readback
+        # is top-down and can be handed to torch without a copy
+        self.__fbo_resolve = gl.glGenFramebuffers(1)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo_resolve)
+        self.__texture_resolve = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.__texture_resolve)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D, self.__texture_resolve, 0)
+
+        # double-buffered pixel pack buffers for asynchronous readback
+        self.__pbo: List[int] = list(gl.glGenBuffers(2))
+        for pbo in self.__pbo:
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+            gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER, width * height * 4, None, gl.GL_STREAM_READ)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self.__pbo_index: int = 0
+        self.__pbo_pending: Optional[int] = None
+        logger.debug(f"render target {width}x{height} {'rgba8' if rgba8 else 'rgba32f'}")
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.__size
+
+    @property
+    def fbo(self) -> int:
+        return self.__fbo
+
+    @property
+    def pending(self) -> bool:
+        return self.__pbo_pending is not None
+
+    def buffer(self, name:str) -> GLSLPassBuffer:
+        """Ping-pong buffer for a pass, allocated on first use."""
+        if (buffer := self.__buffers.get(name, None)) is None:
+            buffer = self.__buffers[name] = GLSLPassBuffer(*self.__size, self.__rgba8)
+        return buffer
+
+    def allocate(self, names:List[str]) -> None:
+        """Allocate the ping-pong buffers for these passes up front, before
+        any sampler is bound for a draw."""
+        for name in names:
+            self.buffer(name)
+
+    def release(self) -> None:
+        for buffer in self.__buffers.values():
+            buffer.release()
+        self.__buffers = {}
+        gl.glDeleteBuffers(len(self.__pbo), self.__pbo)
+        gl.glDeleteTextures(2, [self.__texture, self.__texture_resolve])
+        gl.glDeleteFramebuffers(2, [self.__fbo, self.__fbo_resolve])
+        self.__pbo = []
+        self.__pbo_pending = None
+
+    def read(self, out:Optional[np.ndarray]=None, source:Optional[int]=None) -> Optional[np.ndarray]:
+        """Queue the readback of what was drawn (into source, or this
+        target's FBO) and return the frame queued before it, if any. Frame N
+        copies while frame N+1 draws."""
+        width, height = self.__size
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, self.__fbo if source is None else source)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, self.__fbo_resolve)
+        gl.glBlitFramebuffer(0, 0, width, height, 0, height, width, 0, gl.GL_COLOR_BUFFER_BIT, gl.GL_NEAREST)
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, self.__fbo_resolve)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.__pbo[self.__pbo_index])
+        gl.glReadPixels(0, 0, width, height, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
+
+        ready = self.flush(out)
+        self.__pbo_pending = self.__pbo_index
+        self.__pbo_index = (self.__pbo_index + 1) % len(self.__pbo)
+        return ready
+
+    def flush(self, out:Optional[np.ndarray]=None) -> Optional[np.ndarray]:
+        """Map the pending PBO and copy it into out (or a new HxWx4 uint8 array)."""
+        if self.__pbo_pending is None:
+            return None
+        width, height = self.__size
+        if out is None:
+            out = np.empty((height, width, 4), dtype=np.uint8)
+        size = width * height * 4
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.__pbo[self.__pbo_pending])
+        ptr = gl.glMapBufferRange(gl.GL_PIXEL_PACK_BUFFER, 0, size, gl.GL_MAP_READ_BIT)
+        ctypes.memmove(out.ctypes.data, ptr, size)
+        gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self.__pbo_pending = None
+        return out
+
 class GLSLShader:
+    # render targets kept per shader for sizes seen recently
+    TARGET_POOL = 4
     PROG_HEADER = """
 #version 440
 
@@ -67,6 +773,7 @@ uniform float	iTime;
 uniform float	iTimeDelta;
 uniform float	iFrameRate;
 uniform int	    iFrame;
+uniform sampler2D iPrevFrame;
 
 #define texture2D texture
 """
@@ -103,70 +810,76 @@ void main()
 }
 """
 
-    def __init__(self, vertex:str=None, fragment:str=None, width:int=IMAGE_SIZE_DEFAULT, height:int=IMAGE_SIZE_DEFAULT, fps:int=30) -> None:
-        if not glfw.init():
-            raise RuntimeError("GLFW did not init")
+    def __init__(self, vertex:str=None, fragment:str=None, width:int=IMAGE_SIZE_DEFAULT, height:int=IMAGE_SIZE_DEFAULT, fps:int=30, rgba8:bool=False) -> None:
         self.__size: Tuple[int, int] = (max(width, IMAGE_SIZE_MIN), max(height, IMAGE_SIZE_MIN))
-        self.__program = None
-        self.__source_vertex: str = None
-        self.__source_fragment: str = None
+        # one [name, cache key, program, setters] per pass, in draw order
+        self.__passes: List[List[Any]] = []
+        # passes read each other (or iPrevFrame) through ping-pong buffers
+        self.__feedback: bool = False
         self.__source_vertex_raw: str = None
         self.__source_fragment_raw: str = None
         self.__runtime: float = 0
         self.__fps: int = min(120, max(1, fps))
         self.__mouse: Tuple[int, int] = (0, 0)
         self.__last_frame = np.zeros((self.__size[1], self.__size[0]), np.uint8)
-        self.__shaderVar = {}
         self.__userVar = {}
-        self.__fbo = None
-        self.__fbo_texture = None
+        # texture unit per input sampler
+        self.__units: Dict[str, int] = {}
+        self.__values: Dict[str, Any] = {}
+        # 8-bit render target for nodes that never need float precision
+        self.__rgba8: bool = rgba8
+        # render targets by (width, height, rgba8); a size change only picks
+        # or allocates a target, the program and textures stay as they are
+        self.__targets: OrderedDict[Tuple[int, int, bool], GLSLRenderTarget] = OrderedDict()
+        self.__target: GLSLRenderTarget = None
         self.__bgcolor = (0, 0, 0, 1.)
         self.__textures = {}
-        self.__window = None
-        self.__init_window(vertex, fragment)
+        # per sampler: (width, height) of the allocated storage and the last
+        # array uploaded into it, so unchanged inputs are not re-sent
+        self.__texture_size: Dict[str, Tuple[int, int]] = {}
+        self.__texture_source: Dict[str, np.ndarray] = {}
+        self.__vao = None
+        self.__ctx: GLContext = None
+        GLWorker().call(self.__init_window, vertex, fragment)
+        GLWorker().track(self)
 
     def __cleanup(self) -> None:
-        glfw.make_context_current(self.__window)
+        if self.__ctx is None:
+            return
+        self.__ctx.make_current()
         old = [v[3] for v in self.__userVar.values() if v[0] == 'sampler2D']
         if len(old):
             gl.glDeleteTextures(old)
+        self.__texture_size = {}
+        self.__texture_source = {}
 
-        if self.__fbo_texture:
-            gl.glDeleteTextures(1, [self.__fbo_texture])
+        for target in self.__targets.values():
+            target.release()
+        self.__targets = OrderedDict()
+        self.__target = None
 
-        if self.__fbo:
-            gl.glDeleteFramebuffers(1, [self.__fbo])
+        if self.__vao:
+            gl.glDeleteVertexArrays(1, [self.__vao])
 
-        if self.__program:
-            gl.glDeleteProgram(self.__program)
+        group = id(gl_share_root())
+        for p in self.__passes:
+            GLSLProgramCache().release(group, p[1])
+        self.__passes = []
 
-        if self.__window:
-            glfw.destroy_window(self.__window)
+        # the context is shared; only this shader's objects go
+        self.__ctx = None
         logger.debug("cleanup")
 
     def __init_window(self, vertex:str=None, fragment:str=None, force:bool=False) -> None:
-        glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
         self.__cleanup()
-        self.__window = glfw.create_window(self.__size[0], self.__size[1], "hidden", None, None)
-        if not self.__window:
-            raise RuntimeError("GLFW did not init window")
-
-        self.__init_framebuffer()
+        self.__ctx = GLWorker().context()
+        self.__ctx.make_current()
+        # core profiles will not draw without a bound vertex array
+        self.__vao = gl.glGenVertexArrays(1)
+        self.__init_target()
         self.__init_program(vertex, fragment, force)
         logger.debug("init window")
 
-    def __compile_shader(self, source:str, shader_type:str) -> None:
-        glfw.make_context_current(self.__window)
-        shader = gl.glCreateShader(shader_type)
-        gl.glShaderSource(shader, source)
-        gl.glCompileShader(shader)
-        if gl.glGetShaderiv(shader, gl.GL_COMPILE_STATUS) != gl.GL_TRUE:
-            log = gl.glGetShaderInfoLog(shader).decode()
-            logger.error(f"Shader compilation error: {log}")
-            raise CompileException(log)
-        # logger.debug(f"{shader_type} compiled")
-        return shader
-
     def __init_program(self, vertex:str=None, fragment:str=None, force:bool=False) -> None:
         if (vertex := self.__source_vertex_raw if vertex is None else vertex) is None:
             logger.debug("Vertex program is empty. Using Default.")
@@ -179,93 +892,116 @@ void main()
         if not force and vertex == self.__source_vertex_raw and fragment == self.__source_fragment_raw:
             return
 
-        glfw.make_context_current(self.__window)
+        self.__ctx.make_current()
+        group = id(gl_share_root())
+        passes = []
         try:
-            gl.glDeleteProgram(self.__program)
-        except Exception as e:
-            pass
-
-        self.__source_vertex = self.__compile_shader(vertex, gl.GL_VERTEX_SHADER)
-        fragment_full = self.PROG_HEADER + fragment + self.PROG_FOOTER
-        self.__source_fragment = self.__compile_shader(fragment_full, gl.GL_FRAGMENT_SHADER)
-
-        self.__program = gl.glCreateProgram()
-        gl.glAttachShader(self.__program, self.__source_vertex)
-        gl.glAttachShader(self.__program, self.__source_fragment)
-        gl.glLinkProgram(self.__program)
-        if gl.glGetProgramiv(self.__program, gl.GL_LINK_STATUS) != gl.GL_TRUE:
-            log = gl.glGetProgramInfoLog(self.__program).decode()
-            logger.error(f"Program linking error: {log}")
-            raise RuntimeError(log)
+            for name, body in shader_passes(fragment):
+                key, program = GLSLProgramCache().acquire(group, vertex, self.PROG_HEADER + body + self.PROG_FOOTER)
+                passes.append([name, key, program, {}])
+        except CompileException:
+            for p in passes:
+                GLSLProgramCache().release(group, p[1])
+            raise
+
+        for p in self.__passes:
+            GLSLProgramCache().release(group, p[1])
+        self.__passes = passes
 
         self.__source_fragment_raw = fragment
         self.__source_vertex_raw = vertex
 
-        gl.glUseProgram(self.__program)
-
-        self.__shaderVar = {}
-        statics = ['iResolution', 'iTime', 'iFrameRate', 'iFrame', 'iMouse']
-        for s in statics:
-            if (val := gl.glGetUniformLocation(self.__program, s)) > -1:
-                self.__shaderVar[s] = val
-
-        if (resolution := self.__shaderVar.get('iResolution', -1)) > -1:
-            gl.glUniform3f(resolution, self.__size[0], self.__size[1], 0)
-
+        # pass outputs and the previous frame are sampled, never inputs
+        internal = [p[0] for p in passes if p[0]] + ['iPrevFrame']
         self.__userVar = {}
+        self.__units = {}
         # read the fragment and setup the vars....
         for match in RE_VARIABLE.finditer(self.__source_fragment_raw):
             typ, name, default, val_min, val_max, val_step, tooltip = match.groups()
+            if name in internal:
+                continue
             self.__textures[name] = None
+            self.__texture_size.pop(name, None)
+            self.__texture_source.pop(name, None)
             if typ in ['sampler2D']:
                 self.__textures[name] = gl.glGenTextures(1)
+                self.__units[name] = len(self.__units)
             # logger.debug(f"{name}.{typ}: {default} {val_min} {val_max} {val_step} {tooltip}")
             self.__userVar[name] = [
                 # type
                 typ,
-                # gl location
-                gl.glGetUniformLocation(self.__program, name),
+                # gl location -- per pass, see the setters
+                -1,
                 # default value
                 default,
                 # texture id -- if a texture
                 self.__textures[name]
             ]
 
+        # setters for every active uniform of every pass; optimized out
+        # uniforms get none
+        statics = {'iResolution': 'vec3', 'iTime': 'float', 'iTimeDelta': 'float',
+                   'iFrameRate': 'float', 'iFrame': 'int', 'iMouse': 'vec4'}
+        statics.update({k: v[0] for k, v in self.__userVar.items()})
+        statics.update({k: 'sampler2D' for k in internal})
+        self.__feedback = len(passes) > 1
+        for _, _, program, setters in passes:
+            gl.glUseProgram(program)
+            state = GLSLProgramCache().state(program)
+            for name, typ in statics.items():
+                if (loc := gl.glGetUniformLocation(program, name)) > -1:
+                    setters[name] = uniform_setter('int' if typ == 'sampler2D' else typ, loc, state)
+            if 'iPrevFrame' in setters:
+                self.__feedback = True
+        self.__init_buffers()
+
         logger.debug("init vars")
         logger.debug("init program")
 
-    def __init_framebuffer(self) -> None:
-        glfw.make_context_current(self.__window)
-
-        self.__fbo = gl.glGenFramebuffers(1)
-        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
-
-        self.__fbo_texture = gl.glGenTextures(1)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.__fbo_texture)
-        glfw.set_window_size(self.__window, self.__size[0], self.__size[1])
-
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA32F, self.__size[0], self.__size[1], 0, gl.GL_RGBA, gl.GL_FLOAT, None)
-
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-        gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D, self.__fbo_texture, 0)
-
-        gl.glViewport(0, 0, self.__size[0], self.__size[1])
-        logger.debug("init framebuffer")
+    def __init_target(self) -> None:
+        """Switch to the render target for the current size and format."""
+        key = (self.__size[0], self.__size[1], self.__rgba8)
+        if (target := self.__targets.get(key, None)) is not None and target is self.__target:
+            return
+        if self.__target is not None:
+            # the pending frame belongs to the old target
+            self.flush()
+
+        self.__ctx.make_current()
+        if (target := self.__targets.pop(key, None)) is None:
+            target = GLSLRenderTarget(*key)
+        self.__targets[key] = target
+        while len(self.__targets) > self.TARGET_POOL:
+            _, old = self.__targets.popitem(last=False)
+            old.release()
+        self.__target = target
+        self.__init_buffers()
+
+    def __init_buffers(self) -> None:
+        """Allocate the pass buffers of the current target for the current
+        passes, so no allocation happens mid-draw."""
+        if self.__feedback and self.__target is not None:
+            self.__target.allocate([p[0] for p in self.__passes])
 
     def __del__(self) -> None:
-        self.__cleanup()
-        #if self.__window is not None:
-        #    if glfw is not None:
-        #        glfw.destroy_window(self.__window)
-        #    self.__window = None
-        # glfw.terminate()
+        self.release()
+
+    def release(self) -> None:
+        """Free the GL objects of this shader; the shared context stays."""
+        if self.__ctx is None:
+            return
+        worker = GLWorker()
+        if worker.on_thread:
+            self.__cleanup()
+        elif worker.running:
+            worker.call(self.__cleanup)
 
     @property
     def vertex(self) -> str:
         return self.__source_vertex_raw
 
     @vertex.setter
+    @gl_call
     def vertex(self, program:str) -> None:
         self.__init_program(vertex=program)
 
@@ -274,6 +1010,7 @@ void main()
         return self.__source_fragment_raw
 
     @fragment.setter
+    @gl_call
     def fragment(self, program:str) -> None:
         self.__init_program(fragment=program)
 
@@ -282,13 +1019,14 @@ void main()
         return self.__size
 
     @size.setter
+    @gl_call
     def size(self, size:Tuple[int, int]) -> None:
         size = (min(IMAGE_SIZE_MAX, max(IMAGE_SIZE_MIN, size[0])),
                 min(IMAGE_SIZE_MAX, max(IMAGE_SIZE_MIN, size[1])))
 
         if size[0] != self.__size[0] or size[1] != self.__size[1]:
             self.__size = size
-            self.__init_window(force=True)
+            self.__init_target()
 
     @property
     def runtime(self) -> float:
@@ -307,10 +1045,6 @@ void main()
     def fps(self, fps:int) -> None:
         fps = max(1, min(120, int(fps)))
         self.__fps = fps
-        if (iFrameRate := self.__shaderVar.get('iFrameRate', -1)) > -1:
-            glfw.make_context_current(self.__window)
-            gl.glUseProgram(self.__program)
-            gl.glUniform1f(self.__shaderVar['iFrameRate'], iFrameRate)
 
     @property
     def mouse(self) -> Tuple[int, int]:
@@ -328,6 +1062,17 @@ void main()
     def last_frame(self) -> float:
         return self.__last_frame
 
+    @property
+    def rgba8(self) -> bool:
+        return self.__rgba8
+
+    @rgba8.setter
+    @gl_call
+    def rgba8(self, rgba8:bool) -> None:
+        if rgba8 != self.__rgba8:
+            self.__rgba8 = rgba8
+            self.__init_target()
+
     @property
     def bgcolor(self) -> Tuple[int, ...]:
         return self.__bgcolor
@@ -336,75 +1081,397 @@ void main()
     def bgcolor(self, color:Tuple[int, ...]) -> None:
         self.__bgcolor = tuple(float(x) / 255. for x in color)
 
-    def render(self, time_delta:float=0., **kw) -> np.ndarray:
-        glfw.make_context_current(self.__window)
-        gl.glUseProgram(self.__program)
+    def __bind(self) -> None:
+        """Make the context current and bind the per-run state."""
+        self.__ctx.make_current()
+        gl.glBindVertexArray(self.__vao)
+
+        # every input sampler keeps its texture unit for the whole run
+        for uk, unit in self.__units.items():
+            if (texture := self.__textures[uk]) is None:
+                logger.error(f"texture {uk} is None")
+            gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+
+        gl.glViewport(0, 0, self.__size[0], self.__size[1])
+        gl.glClearColor(*self.__bgcolor)
 
+    def __update(self, time_delta:float, kw:Dict[str, Any]) -> None:
+        """Take the values for the next frame and upload changed textures."""
         self.runtime = time_delta
+        self.__values = kw
+        for uk, unit in self.__units.items():
+            if (val := kw.get(uk, None)) is not None:
+                self.__upload_texture(uk, unit, self.__textures[uk], val)
 
-        if (val := self.__shaderVar.get('iTime', -1)) > -1:
-            gl.glUniform1f(val, self.__runtime)
+    def __apply(self, setters:Dict[str, Callable[[Any], None]]) -> None:
+        """Send the frame values to one pass program.
 
-        if (val := self.__shaderVar.get('iFrameRate', -1)) > -1:
-            gl.glUniform1i(val, self.__fps)
+        Values equal to what the program already holds are not sent again.
+        """
+        if (setter := setters.get('iResolution', None)) is not None:
+            setter((self.__size[0], self.__size[1], 0))
 
-        if (val := self.__shaderVar.get('iFrame', -1)) > -1:
-            gl.glUniform1i(val, self.frame)
+        if (setter := setters.get('iFrameRate', None)) is not None:
+            setter(self.__fps)
 
-        if (val := self.__shaderVar.get('iMouse', -1)) > -1:
-            gl.glUniform4f(val, self.__mouse[0], self.__mouse[1], 0, 0)
+        if (setter := setters.get('iTimeDelta', None)) is not None:
+            setter(1. / self.__fps)
 
-        texture_index = 0
-        for uk, uv in self.__userVar.items():
-            p_type, p_loc, p_value, _ = uv
-            val = kw.get(uk, p_value)
-
-            if p_type == 'sampler2D':
-                texture = self.__textures[uk]
-                if texture is None:
-                    logger.error(f"texture {uk} is None")
-                gl.glActiveTexture(gl.GL_TEXTURE0 + texture_index)
-                gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
-
-                if val is not None:
-                    val = image_convert(val, 4)
-                    val = val[::-1,:]
-                    val = val.astype(np.float32) / 255.0
-                    val = cv2.resize(val, self.__size, interpolation=cv2.INTER_LINEAR)
-                    gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA32F, self.__size[0], self.__size[1], 0, gl.GL_RGBA, gl.GL_FLOAT, val)
-                    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
-                    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-                    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
-                    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
-
-                gl.glUniform1i(p_loc, texture_index)
-                texture_index += 1
-            else:
-                funct = LAMBDA_UNIFORM[p_type]
-                if isinstance(val, str):
-                    val = val.split(',')
-                val = parse_value(val, PTYPE[p_type], 0)
-                if not isinstance(val, (list, tuple)):
-                    val = [val]
-                funct(p_loc, *val)
+        if (setter := setters.get('iMouse', None)) is not None:
+            setter((self.__mouse[0], self.__mouse[1], 0, 0))
 
-        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
-        gl.glClearColor(*self.__bgcolor)
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
-        gl.glDrawArrays(gl.GL_TRIANGLES, 0, 3)
+        if (setter := setters.get('iTime', None)) is not None:
+            setter(self.__runtime)
 
-        data = gl.glReadPixels(0, 0, self.__size[0], self.__size[1], gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
-        image = np.frombuffer(data, dtype=np.uint8).reshape(self.__size[1], self.__size[0], 4)
-        self.__last_frame = image[::-1, :, :]
+        if (setter := setters.get('iFrame', None)) is not None:
+            setter(self.frame)
 
-        glfw.poll_events()
+        for uk, uv in self.__userVar.items():
+            if (setter := setters.get(uk, None)) is None:
+                continue
+            if uv[0] == 'sampler2D':
+                setter(self.__units[uk])
+            else:
+                setter(self.__values.get(uk, uv[2]))
+
+    def __draw(self, out:Optional[np.ndarray]=None) -> Optional[np.ndarray]:
+        """Draw every pass, queue the readback of the last one and collect
+        the previous frame.
+
+        A single pass without iPrevFrame draws straight into the render
+        target. Otherwise every pass draws into its own ping-pong buffer;
+        sampling a pass by name gives its output from this frame if it ran
+        earlier, else from the previous frame, and iPrevFrame is the last
+        pass of the previous frame.
+        """
+        target = self.__target
+        source = None
+        if not self.__feedback:
+            _, _, program, setters = self.__passes[0]
+            gl.glUseProgram(program)
+            self.__apply(setters)
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, target.fbo)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+            gl.glDrawArrays(gl.GL_TRIANGLES, 0, 3)
+        else:
+            final = self.__passes[-1][0]
+            names = [p[0] for p in self.__passes]
+            for name, _, program, setters in self.__passes:
+                gl.glUseProgram(program)
+                self.__apply(setters)
+                unit = len(self.__units)
+                for other in names + ['iPrevFrame']:
+                    if (setter := setters.get(other, None)) is None:
+                        continue
+                    buffer = target.buffer(final if other == 'iPrevFrame' else other)
+                    gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+                    gl.glBindTexture(gl.GL_TEXTURE_2D, buffer.texture)
+                    setter(unit)
+                    unit += 1
+                buffer = target.buffer(name)
+                gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, buffer.back)
+                gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+                gl.glDrawArrays(gl.GL_TRIANGLES, 0, 3)
+                buffer.swap()
+            source = target.buffer(final).front
+
+        ready = target.read(out, source)
+        self.__ctx.poll()
+        if ready is not None:
+            self.__last_frame = ready
+        return ready
+
+    @gl_call
+    def render_async(self, time_delta:float=0., out:Optional[np.ndarray]=None, **kw) -> Optional[np.ndarray]:
+        """Queue a frame and return the one queued before it, if there was one.
+
+        Readback goes through two pixel pack buffers so the transfer of frame N
+        overlaps the draw of frame N+1. Call flush() to collect the last frame.
+        """
+        self.__bind()
+        self.__update(time_delta, kw)
+        return self.__draw(out)
+
+    @gl_call
+    def render_batch(self, times:List[float], frames:List[Dict[str, Any]],
+                     out:Optional[np.ndarray]=None, callback:Optional[Callable[[int], None]]=None) -> np.ndarray:
+        """Render a whole batch into a [B,H,W,4] uint8 array.
+
+        The context and texture units are bound once; per frame only the
+        uniforms or textures that differ from what the programs already hold
+        are sent. Readback of frame N overlaps
+        the draw of frame N+1 and lands directly in out[N].
+
+        callback, if given, is called with each frame index once it is drawn.
+        """
+        count = len(times)
+        width, height = self.__size
+        if out is None:
+            out = np.empty((count, height, width, 4), dtype=np.uint8)
+
+        self.flush()
+        self.__bind()
+        for idx in range(count):
+            self.__update(times[idx], frames[idx % len(frames)])
+            self.__draw(out[idx-1] if idx > 0 else None)
+            if callback is not None:
+                callback(idx)
+        if count > 0:
+            self.flush(out[count-1])
+        return out
+
+    def __upload_texture(self, name:str, unit:int, texture:int, image:np.ndarray) -> None:
+        """Update a sampler texture in place from uint8 image data.
+
+        Storage is allocated once per uniform and input size; after that only
+        glTexSubImage2D is used. The texture keeps the input resolution and GL
+        filtering does any resampling to the render size. Passing the same
+        array object again skips the upload entirely.
+        """
+        if self.__texture_source.get(name) is image:
+            return
 
-        return self.__last_frame
+        data = image_convert(image, 4)
+        if data.dtype != np.uint8:
+            data = np.clip(data, 0, 255).astype(np.uint8)
+        # GL rows go bottom-up
+        data = np.ascontiguousarray(data[::-1])
+        height, width = data.shape[:2]
+
+        # passes rebind units between frames; never trust what is bound
+        gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        if self.__texture_size.get(name) != (width, height):
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, data)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+            self.__texture_size[name] = (width, height)
+        else:
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, width, height, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, data)
+        self.__texture_source[name] = image
+
+    @gl_call
+    def flush(self, out:Optional[np.ndarray]=None) -> Optional[np.ndarray]:
+        """Collect the frame still waiting in a PBO, if any."""
+        if self.__target is None or not self.__target.pending:
+            return None
+        self.__ctx.make_current()
+        if (ready := self.__target.flush(out)) is not None:
+            self.__last_frame = ready
+        return ready
+
+    def submit(self, time_delta:float=0., **kw) -> Future:
+        """render() on the GL worker, without waiting for it."""
+        return GLWorker().submit(self.render, time_delta, **kw)
+
+    def submit_batch(self, times:List[float], frames:List[Dict[str, Any]],
+                     out:Optional[np.ndarray]=None, callback:Optional[Callable[[int], None]]=None) -> Future:
+        """render_batch() on the GL worker, without waiting for it."""
+        return GLWorker().submit(self.render_batch, times, frames, out, callback)
+
+    @gl_call
+    def render(self, time_delta:float=0., **kw) -> np.ndarray:
+        """Render a single frame and wait for its readback.
+
+        The result is a contiguous, top-down HxWx4 uint8 array.
+        """
+        self.flush()
+        self.render_async(time_delta, **kw)
+        return self.flush()
+
+def shader_passes(shader: str) -> List[Tuple[str, str]]:
+    """Split a fragment program into (name, source) passes.
+
+    Passes start at a `// pass: NAME` line and run in file order; the last
+    one is the output. Anything before the first marker is shared by every
+    pass. Without markers the whole program is one unnamed pass.
+    """
+    marks = list(RE_SHADER_PASS.finditer(shader))
+    if len(marks) == 0:
+        return [('', shader)]
+    common = shader[:marks[0].start()]
+    ret = []
+    for idx, mark in enumerate(marks):
+        end = marks[idx+1].start() if idx+1 < len(marks) else len(shader)
+        ret.append((mark.group(1), common + shader[mark.end():end]))
+    return ret
 
 def shader_meta(shader: str) -> Dict[str, Any]:
     ret = {}
     for match in RE_SHADER_META.finditer(shader):
         key, value = match.groups()
         ret[key] = value
-    ret['_'] = [match.groups() for match in RE_VARIABLE.finditer(shader)]
+    internal = [p[0] for p in shader_passes(shader)] + ['iPrevFrame']
+    ret['_'] = [match.groups() for match in RE_VARIABLE.finditer(shader) if match.group(2) not in internal]
     return ret
+
+# =============================================================================
+# === ACCELERATED IMAGE OPS ===
+# =============================================================================
+
+# hue/saturation/value adjust in one pass; the same rgb <-> hsv math as
+# color-convert_rgb2hsv.frag and color-convert_hsv2rgb.frag
+GLSL_HSV_ADJUST = """
+uniform sampler2D image;
+uniform vec3 adjust;
+
+const float Epsilon = 1e-10;
+
+void mainImage(out vec4 fragColor, vec2 fragCoord) {
+    vec2 uv = fragCoord.xy / iResolution.xy;
+    vec4 color = texture(image, uv);
+    // channels arrive in cv2 (BGR) order
+    vec3 rgb = color.bgr;
+    vec4 K = vec4(0.0, -1.0 / 3.0, 2.0 / 3.0, -1.0);
+    vec4 p = mix(vec4(rgb.bg, K.wz), vec4(rgb.gb, K.xy), step(rgb.b, rgb.g));
+    vec4 q = mix(vec4(p.xyw, rgb.r), vec4(rgb.r, p.yzx), step(p.x, rgb.r));
+    float d = q.x - min(q.w, q.y);
+    vec3 hsv = vec3(abs(q.z + (q.w - q.y) / (6.0 * d + Epsilon)), d / (q.x + Epsilon), q.x);
+    hsv = vec3(fract(hsv.x + adjust.x), clamp(hsv.yz * adjust.yz, 0.0, 1.0));
+    vec4 L = vec4(1.0, 2.0 / 3.0, 1.0 / 3.0, 3.0);
+    vec3 c = abs(fract(hsv.xxx + L.xyz) * 6.0 - L.www);
+    rgb = hsv.z * mix(L.xxx, clamp(c - L.xxx, 0.0, 1.0), hsv.y);
+    fragColor = vec4(rgb.bgr, color.a);
+}
+"""
+
+class GLSLImageOps(metaclass=Singleton):
+    """Run sup.image colour ops through GL when that is cheaper than the CPU.
+
+    The first large call of an op runs both paths, measures them and checks
+    the GL output against the CPU one; an op that differs by more than the
+    tolerance, or fails in GL, stays on the CPU from then on. After that the
+    predicted cost picks the path -- CPU is seconds per pixel, GL a fixed
+    overhead plus seconds per pixel -- and the timing of the path taken keeps
+    the model current. Both paths are measured again every
+    JOV_GLSL_ACCEL_PROBE calls.
+    """
+    # weight of a new timing in the running per-pixel costs
+    EMA = 0.2
+
+    SOURCE = {
+        'grayscale': 'color-grayscale.frag',
+        'blend': 'comp-blend.frag',
+        'hsv': GLSL_HSV_ADJUST,
+    }
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        # only touched on the GL worker
+        self.__shaders: Dict[str, GLSLShader] = {}
+        # per op: [cpu s/px, gl fixed s, gl s/px, calls since the last probe]
+        self.__cost: Dict[str, List[float]] = {}
+        self.__disabled: Dict[str, str] = {}
+        self.__stats = {'cpu': 0, 'gl': 0, 'probe': 0, 'fallback': 0}
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            cost = {k: tuple(v[:3]) for k, v in self.__cost.items()}
+            return dict(self.__stats, cost=cost, disabled=dict(self.__disabled))
+
+    def __shader(self, op:str) -> GLSLShader:
+        if (shader := self.__shaders.get(op, None)) is None:
+            source = self.SOURCE[op]
+            if source.endswith('.frag'):
+                source = load_file(str(ROOT / 'res' / 'glsl' / source))
+            shader = self.__shaders[op] = GLSLShader(fragment=source, rgba8=True)
+        return shader
+
+    def __render(self, op:str, width:int, height:int, kw:Dict[str, Any]) -> np.ndarray:
+        shader = self.__shader(op)
+        shader.size = (width, height)
+        # fresh views: callers may have changed an array in place since the
+        # last call, so the shader must not skip the upload on identity
+        kw = {k: v.view() if isinstance(v, np.ndarray) else v for k, v in kw.items()}
+        return shader.render(0, **kw)
+
+    def __disable(self, op:str, reason:str) -> None:
+        with self.__lock:
+            self.__disabled[op] = reason
+            self.__stats['fallback'] += 1
+        logger.warning(f"{op}: GL path disabled ({reason})")
+
+    def __learn(self, op:str, index:int, pixels:int, elapsed:float) -> None:
+        with self.__lock:
+            cost = self.__cost[op]
+            cost[index] += self.EMA * (max(0., elapsed) / pixels - cost[index])
+            self.__stats['gl' if index == 2 else 'cpu'] += 1
+
+    def __probe(self, op:str, cpu:Callable[[], np.ndarray], post:Callable[[np.ndarray], np.ndarray],
+                width:int, height:int, kw:Dict[str, Any]) -> np.ndarray:
+        pixels = width * height
+        with self.__lock:
+            self.__stats['probe'] += 1
+        stamp = time.perf_counter()
+        ret = cpu()
+        cost_cpu = (time.perf_counter() - stamp) / pixels
+
+        try:
+            # compile outside the timings, then time a minimum size frame
+            # for the fixed overhead and the real one for the rest
+            GLWorker().call(self.__shader, op)
+            blank = np.zeros((IMAGE_SIZE_MIN, IMAGE_SIZE_MIN, 4), dtype=np.uint8)
+            small = {k: blank if isinstance(v, np.ndarray) else v for k, v in kw.items()}
+            stamp = time.perf_counter()
+            GLWorker().call(self.__render, op, IMAGE_SIZE_MIN, IMAGE_SIZE_MIN, small)
+            fixed = time.perf_counter() - stamp
+            stamp = time.perf_counter()
+            check = post(GLWorker().call(self.__render, op, width, height, kw))
+            elapsed = time.perf_counter() - stamp
+        except Exception as e:
+            self.__disable(op, str(e))
+            return ret
+
+        if check.shape != ret.shape:
+            self.__disable(op, f"shape {check.shape} != {ret.shape}")
+            return ret
+        if (diff := float(np.abs(check.astype(np.int16) - ret).mean())) > JOV_GLSL_ACCEL_TOLERANCE:
+            self.__disable(op, f"mean difference {diff:.3f} > {JOV_GLSL_ACCEL_TOLERANCE}")
+            return ret
+
+        with self.__lock:
+            self.__cost[op] = [cost_cpu, fixed, max(0., elapsed - fixed) / pixels, 0]
+        logger.debug(f"{op}: cpu {cost_cpu * 1e9:.2f}ns/px, gl {fixed * 1e3:.2f}ms + {self.__cost[op][2] * 1e9:.2f}ns/px")
+        return ret
+
+    def run(self, op:str, cpu:Callable[[], np.ndarray], post:Callable[[np.ndarray], np.ndarray],
+            width:int, height:int, **kw) -> np.ndarray:
+        """Return cpu() or the GL render of op with the uniforms in kw.
+
+        post turns the HxWx4 render into what cpu() returns. Small inputs,
+        sizes the render targets cannot take and disabled ops go straight
+        to cpu().
+        """
+        pixels = width * height
+        if op in self.__disabled or pixels < JOV_GLSL_ACCEL_MIN or \
+            min(width, height) < IMAGE_SIZE_MIN or max(width, height) > IMAGE_SIZE_MAX:
+            return cpu()
+
+        with self.__lock:
+            cost = self.__cost.get(op, None)
+            if not (probe := cost is None or cost[3] >= JOV_GLSL_ACCEL_PROBE):
+                cost[3] += 1
+                use_gl = cost[1] + cost[2] * pixels < cost[0] * pixels
+                fixed = cost[1]
+
+        if probe:
+            return self.__probe(op, cpu, post, width, height, kw)
+
+        stamp = time.perf_counter()
+        if not use_gl:
+            ret = cpu()
+            self.__learn(op, 0, pixels, time.perf_counter() - stamp)
+            return ret
+
+        try:
+            ret = post(GLWorker().call(self.__render, op, width, height, kw))
+        except Exception as e:
+            self.__disable(op, str(e))
+            return cpu()
+        self.__learn(op, 2, pixels, time.perf_counter() - stamp - fixed)
+        return ret
@@ -36,7 +36,8 @@ else:
     logger.warning("SKIPPING SPOUT GL SUPPORT")
 
 from Jovimetrix import Singleton
-from Jovimetrix.sup.image import image_load, pil2cv, TYPE_PIXEL, MIN_IMAGE_SIZE
+from Jovimetrix.sup.image import image_load, image_formats, pil2cv, ImageFetcher, \
+    TYPE_PIXEL, MIN_IMAGE_SIZE
 
 # =============================================================================
 
@@ -350,6 +351,36 @@ class MediaStreamURL(MediaStreamBase):
             self.__source.release()
         super().release()
 
+class MediaStreamImageURL(MediaStreamBase):
+    """A still image served over http(s).
+
+    Uses the shared fetcher so the connection is pooled and refreshes are
+    conditional requests rather than full downloads."""
+
+    REFRESH = 1.
+
+    def __init__(self, url:str, fps:float=30) -> None:
+        self.__url = url
+        self.__last = None
+        self.__next = 0
+        super().__init__(fps)
+
+    def callback(self) -> Any:
+        if (now := time.perf_counter()) >= self.__next:
+            self.__next = now + self.REFRESH
+            if (image := ImageFetcher().fetch(self.__url)) is not None:
+                self.__last = image
+        return self.__last
+
+    @property
+    def url(self) -> str:
+        return self.__url
+
+    def capture(self) -> bool:
+        if self.__last is None:
+            self.__last = ImageFetcher().fetch(self.__url)
+        return super().capture() if self.__last is not None else False
+
 class MediaStreamDevice(MediaStreamURL):
     """A system device like a web camera."""
     def __init__(self, url:int|str, fps:float=30) -> None:
@@ -479,7 +510,10 @@ class StreamManager(metaclass=Singleton):
                         url = int(url)
                         StreamManager.STREAM[url] = MediaStreamDevice(url, fps=fps)
                     except Exception as _:
-                        StreamManager.STREAM[url] = MediaStreamURL(url, fps=fps)
+                        if ImageFetcher.is_url(url) and os.path.splitext(url.split('?')[0])[1].lower() in image_formats():
+                            StreamManager.STREAM[url] = MediaStreamImageURL(url, fps=fps)
+                        else:
+                            StreamManager.STREAM[url] = MediaStreamURL(url, fps=fps)
 
                 stream = StreamManager.STREAM[url]
 
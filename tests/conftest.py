@@ -0,0 +1,51 @@
+"""
+Jovimetrix - http://www.github.com/amorano/jovimetrix
+Test Setup
+
+The node pack imports itself as Jovimetrix, whatever folder it was cloned to.
+"""
+
+import sys
+import pytest
+import importlib.util
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+if "Jovimetrix" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("Jovimetrix", ROOT / "__init__.py",
+                                                  submodule_search_locations=[str(ROOT)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["Jovimetrix"] = module
+    try:
+        spec.loader.exec_module(module)
+    except ImportError:
+        # the tests needing the package skip on their own
+        sys.modules.pop("Jovimetrix")
+
+@pytest.fixture(scope="session")
+def gl_shader():
+    """sup.shader once a GL context exists; skips without one. A box with no
+    display uses EGL or OSMesa, e.g. Mesa llvmpipe on a CPU-only runner."""
+    shader = pytest.importorskip("Jovimetrix.sup.shader")
+    try:
+        shader.GLWorker().call(shader.gl_share_root)
+    except Exception as e:
+        pytest.skip(f"no GL context: {e}")
+    return shader
+
+class PromptServerStub:
+    """Records what the nodes would send to the frontend."""
+    def __init__(self) -> None:
+        self.sent = []
+
+    def send_sync(self, route:str, data:dict) -> None:
+        self.sent.append((route, dict(data)))
+
+@pytest.fixture
+def prompt_server(monkeypatch):
+    """Stand-in for server.PromptServer.instance inside Jovimetrix."""
+    jovi = pytest.importorskip("Jovimetrix")
+    server = PromptServerStub()
+    monkeypatch.setattr(jovi, "PromptServer", type("PromptServer", (), {"instance": server}), raising=False)
+    return server
@@ -0,0 +1,180 @@
+"""
+Jovimetrix - http://www.github.com/amorano/jovimetrix
+GLSL Node Registration and Change Detection Tests
+"""
+
+import os
+import math
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("comfy.utils")
+create_glsl = pytest.importorskip("Jovimetrix.core.create_glsl")
+from Jovimetrix import Lexicon
+
+# =============================================================================
+
+STATIC = """
+uniform sampler2D image;
+uniform float amount; // 0.5; 0; 1; 0.01
+
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  fragColor = texture(image, fragCoord / iResolution.xy) * amount;
+}
+"""
+
+ANIMATED = """
+uniform float speed; // 1.0
+
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  fragColor = vec4(fract(iTime * speed));
+}
+"""
+
+FEEDBACK = """
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  fragColor = texture(iPrevFrame, fragCoord / iResolution.xy) * 0.5;
+}
+"""
+
+def node(name:str, fragment:str) -> type:
+    return create_glsl.glsl_node(name, f"{name}.frag", fragment, create_glsl.shader_meta(fragment))[1]
+
+def test_hash_stable() -> None:
+    """Equal inputs give the same hash, even from different tensor objects."""
+    static = node("static", STATIC)
+    image = torch.rand((1, 64, 64, 4), generator=torch.Generator().manual_seed(0))
+    first = static.IS_CHANGED(image=image, amount=0.5, **{Lexicon.TIME: 0.})
+    again = static.IS_CHANGED(image=image.clone(), amount=0.5, **{Lexicon.TIME: 0.})
+    assert isinstance(first, str)
+    assert first == again
+    # keyword order does not matter
+    assert first == static.IS_CHANGED(**{Lexicon.TIME: 0.}, amount=0.5, image=image)
+
+def test_hash_changes() -> None:
+    """Uniforms, input pixels, time and the program all change the hash."""
+    static = node("static", STATIC)
+    image = torch.rand((1, 64, 64, 4), generator=torch.Generator().manual_seed(0))
+    base = static.IS_CHANGED(image=image, amount=0.5, **{Lexicon.TIME: 0.})
+    edited = image.clone()
+    edited[0, 10, 10, 0] += 0.01
+    others = [
+        static.IS_CHANGED(image=image, amount=0.51, **{Lexicon.TIME: 0.}),
+        static.IS_CHANGED(image=edited, amount=0.5, **{Lexicon.TIME: 0.}),
+        static.IS_CHANGED(image=image, amount=0.5, **{Lexicon.TIME: 1.}),
+        node("other", STATIC + "\n").IS_CHANGED(image=image, amount=0.5, **{Lexicon.TIME: 0.}),
+    ]
+    assert len(set(others + [base])) == len(others) + 1
+
+def test_hash_large_tensor() -> None:
+    """Tensors past HASH_SAMPLE are sampled but still stable and sensitive."""
+    static = node("static", STATIC)
+    image = torch.rand((1, 1024, 1024, 4), generator=torch.Generator().manual_seed(1))
+    assert image.numel() > create_glsl.HASH_SAMPLE
+    base = static.IS_CHANGED(image=image, amount=0.5)
+    assert base == static.IS_CHANGED(image=image.clone(), amount=0.5)
+    edited = image.clone()
+    edited[0, 0, 1, 0] += 0.5
+    assert base != static.IS_CHANGED(image=edited, amount=0.5)
+
+def test_always_dirty() -> None:
+    """Only clock-driven single frames and feedback stay dirty."""
+    animated = node("animated", ANIMATED)
+    assert math.isnan(animated.IS_CHANGED(speed=1., **{Lexicon.BATCH: 0}))
+    # a batch renders a fixed span of time
+    batch = animated.IS_CHANGED(speed=1., **{Lexicon.BATCH: 8, Lexicon.TIME: 0.})
+    assert batch == animated.IS_CHANGED(speed=1., **{Lexicon.BATCH: 8, Lexicon.TIME: 0.})
+    assert math.isnan(node("feedback", FEEDBACK).IS_CHANGED(**{Lexicon.BATCH: 8}))
+
+def test_workflow_hit_rate(record_property) -> None:
+    """Queue a five node workflow 20 times, editing one uniform every fifth
+    queue: only the edited node re-runs."""
+    image = torch.rand((1, 256, 256, 4), generator=torch.Generator().manual_seed(2))
+    workflow = {
+        "1": (node("static", STATIC), {"image": image, "amount": 0.5}),
+        "2": (node("blend", STATIC), {"image": image, "amount": 0.25}),
+        "3": (node("animated", ANIMATED), {"speed": 1., Lexicon.BATCH: 24}),
+        "4": (node("clock", ANIMATED), {"speed": 2., Lexicon.BATCH: 0}),
+        "5": (node("feedback", FEEDBACK), {Lexicon.BATCH: 4}),
+    }
+    last = {}
+    hits = runs = 0
+    start = time.perf_counter()
+    for queue in range(20):
+        if queue and queue % 5 == 0:
+            workflow["1"][1]["amount"] += 0.1
+        for ident, (class_def, kw) in workflow.items():
+            key = class_def.IS_CHANGED(**kw)
+            # nan never equals itself, as in ComfyUI's cache check
+            if ident in last and last[ident] == key:
+                hits += 1
+            else:
+                runs += 1
+            last[ident] = key
+    elapsed = (time.perf_counter() - start) / (20 * len(workflow))
+    rate = hits / (hits + runs)
+    record_property("hit_rate", rate)
+    record_property("is_changed_ms", elapsed * 1000)
+    print(f"hit rate {rate:.2f}, IS_CHANGED {elapsed * 1000:.3f} ms")
+    # first queue runs all 5; after that nodes 4 and 5 always, node 1 on 3 edits
+    assert runs == 5 + 19 * 2 + 3
+    assert hits == 100 - runs
+
+# =============================================================================
+
+SYNTHETIC = """
+// name: synthetic {idx}
+// desc: generated shader {idx}
+uniform sampler2D image;
+uniform float gain; // 1.0; 0; 4; 0.01 | Gain
+uniform vec3 tint; // 1, 0.5, 0.25 | Tint
+uniform int steps; // {idx}; 1; 64; 1
+
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {{
+  fragColor = texture(image, fragCoord / iResolution.xy) * gain * vec4(tint, 1.0);
+}}
+"""
+
+def test_meta_cache(tmp_path, record_property) -> None:
+    """500 shaders: the cold start parses every file, a warm one parses none,
+    and an edit re-parses only that file."""
+    folder = tmp_path / "glsl"
+    folder.mkdir()
+    files = []
+    for idx in range(500):
+        fname = folder / f"synthetic_{idx:03d}.frag"
+        fname.write_text(SYNTHETIC.format(idx=idx), encoding='utf-8')
+        files.append(str(fname))
+    cache_file = tmp_path / "meta.json"
+
+    def load() -> tuple:
+        cache = create_glsl.GLSLMetaCache(cache_file)
+        start = time.perf_counter()
+        metas = [cache.meta(f)[1] for f in files]
+        cache.save()
+        return cache, metas, time.perf_counter() - start
+
+    cold, cold_meta, cold_time = load()
+    assert cold.stats['parse'] == 500
+    warm, warm_meta, warm_time = load()
+    assert warm.stats['parse'] == 0 and warm.stats['hit'] == 500
+    # json hands the uniform rows back as lists; glsl_node takes either
+    params = lambda meta: [tuple(p) for p in meta['_']]
+    assert [params(m) for m in warm_meta] == [params(m) for m in cold_meta]
+    assert params(warm_meta[7]) == params(create_glsl.shader_meta(SYNTHETIC.format(idx=7)))
+
+    # touched but unchanged keeps its entry; edited is parsed again
+    stat = os.stat(files[1])
+    os.utime(files[1], (stat.st_atime, stat.st_mtime + 10))
+    with open(files[2], 'a', encoding='utf-8') as f:
+        f.write("\n// edited\n")
+    edit, _, _ = load()
+    assert edit.stats['parse'] == 1
+    assert edit.stats['touched'] == 1
+    assert edit.stats['hit'] == 498
+
+    record_property("cold_ms", cold_time * 1000)
+    record_property("warm_ms", warm_time * 1000)
+    print(f"500 shaders: cold {cold_time * 1000:.1f} ms, warm {warm_time * 1000:.1f} ms")
@@ -0,0 +1,136 @@
+"""
+Jovimetrix - http://www.github.com/amorano/jovimetrix
+URL Fetch Tests
+"""
+
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+image = pytest.importorskip("Jovimetrix.sup.image")
+
+# =============================================================================
+
+COUNT = 100
+MODIFIED = "Mon, 19 Oct 2026 00:00:00 GMT"
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves /<n>.png with an ETag and Last-Modified; honours both."""
+    # keep-alive, so the pooled session reuses its connections
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        try:
+            idx = int(self.path.strip('/').split('.')[0])
+            data = self.server.images[idx]
+        except Exception:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{idx}-{self.server.version}"'
+        if self.headers.get("If-None-Match") == etag or \
+            (self.headers.get("If-None-Match") is None and self.headers.get("If-Modified-Since") == MODIFIED):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", MODIFIED)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *arg) -> None:
+        pass
+
+@pytest.fixture(scope="module")
+def server():
+    rng = np.random.default_rng(0)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.version = 0
+    httpd.pixels = [rng.integers(0, 256, (32, 32, 3), dtype=np.uint8) for _ in range(COUNT)]
+    httpd.images = [cv2.imencode('.png', p)[1].tobytes() for p in httpd.pixels]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def fetcher(**kw) -> "image.ImageFetcher":
+    """A private fetcher, not the process-wide singleton."""
+    return type.__call__(image.ImageFetcher, **kw)
+
+def url(server, idx:int) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/{idx}.png"
+
+def test_revalidate(server) -> None:
+    """A repeat load is a conditional request answered by a 304."""
+    loader = fetcher()
+    first = loader.fetch(url(server, 0))
+    assert np.array_equal(first, server.pixels[0])
+    first[:] = 0
+    again = loader.fetch(url(server, 0))
+    assert np.array_equal(again, server.pixels[0])
+    stats = loader.stats
+    assert stats['miss'] == 1 and stats['hit'] == 1
+
+    # the server changed the file, so the validator no longer matches
+    server.version += 1
+    assert np.array_equal(loader.fetch(url(server, 0)), server.pixels[0])
+    assert loader.stats['miss'] == 2
+    assert loader.fetch(url(server, COUNT)) is None
+    assert loader.stats['error'] == 1
+
+def test_cache_bytes(server) -> None:
+    """The decoded cache stays under its byte budget."""
+    frame = server.pixels[0].nbytes
+    loader = fetcher(limit=frame * 10)
+    loader.fetch_all([url(server, i) for i in range(20)])
+    stats = loader.stats
+    assert stats['entries'] == 10
+    assert stats['size'] <= frame * 10
+
+    # the oldest were evicted, the newest revalidate
+    loader.fetch(url(server, 19))
+    loader.fetch(url(server, 0))
+    assert loader.stats['hit'] == 1
+    assert loader.stats['miss'] == 21
+
+def test_throughput(server, record_property) -> None:
+    """100 small images: serial cold, concurrent cold, concurrent warm."""
+    urls = [url(server, i) for i in range(COUNT)]
+
+    def timed(func):
+        start = time.perf_counter()
+        ret = func()
+        return ret, time.perf_counter() - start
+
+    serial = fetcher()
+    latency = sorted(timed(lambda: serial.fetch(u))[1] for u in urls)
+    cold_serial = sum(latency)
+    record_property("latency_p50_ms", latency[COUNT // 2] * 1000)
+    record_property("latency_p95_ms", latency[COUNT * 95 // 100] * 1000)
+    print(f"latency: p50 {latency[COUNT // 2] * 1000:.2f} ms, p95 {latency[COUNT * 95 // 100] * 1000:.2f} ms")
+    loader = fetcher()
+    cold, cold_pool = timed(lambda: loader.fetch_all(urls))
+    warm, warm_pool = timed(lambda: loader.fetch_all(urls))
+    for idx in range(COUNT):
+        assert np.array_equal(cold[idx], server.pixels[idx])
+        assert np.array_equal(warm[idx], server.pixels[idx])
+    assert loader.stats['hit'] == COUNT
+
+    for key, val in [('serial_cold', cold_serial), ('pool_cold', cold_pool), ('pool_warm', warm_pool)]:
+        record_property(f"{key}_img_s", COUNT / val)
+        record_property(f"{key}_ms", val * 1000 / COUNT)
+        print(f"{key}: {COUNT / val:.0f} img/s, {val * 1000 / COUNT:.2f} ms/img")
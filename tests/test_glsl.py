@@ -0,0 +1,109 @@
+"""
+Jovimetrix - http://www.github.com/amorano/jovimetrix
+GLSL Node Tests
+
+Everything here renders offscreen, so it runs on EGL or OSMesa without a
+display; Mesa llvmpipe is enough.
+"""
+
+import os
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("OpenGL")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# =============================================================================
+
+SHADERS = sorted((ROOT / 'res' / 'glsl').rglob('*.frag'))
+
+def test_import_leaves_platform() -> None:
+    """Importing sup.shader does not set PYOPENGL_PLATFORM for the process."""
+    env = {k: v for k, v in os.environ.items() if k not in ('PYOPENGL_PLATFORM', 'JOV_GL_BACKEND')}
+    env.pop('DISPLAY', None)
+    env.pop('WAYLAND_DISPLAY', None)
+    script = f"""
+import sys, os
+sys.path.insert(0, {str(ROOT / 'tests')!r})
+import conftest
+from Jovimetrix.sup import shader
+assert shader.JOV_GL_BACKEND == 'egl' or not sys.platform.startswith('linux'), shader.JOV_GL_BACKEND
+assert 'PYOPENGL_PLATFORM' not in os.environ
+assert 'OpenGL.platform' not in sys.modules
+"""
+    ret = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True)
+    if "ModuleNotFoundError" in ret.stderr:
+        pytest.skip(ret.stderr.strip().splitlines()[-1])
+    assert ret.returncode == 0, ret.stderr
+
+@pytest.mark.parametrize("fname", SHADERS, ids=[f.name for f in SHADERS])
+def test_bundled_shader(gl_shader, fname) -> None:
+    """Every bundled fragment program compiles and renders with its defaults."""
+    source = fname.read_text(encoding='utf-8')
+    meta = gl_shader.shader_meta(source)
+    glsl = gl_shader.GLSLShader(fragment=source, width=64, height=64, rgba8=True)
+    try:
+        frame = np.random.default_rng(0).integers(0, 256, (64, 64, 4), dtype=np.uint8)
+        kw = {p[1]: frame for p in meta['_'] if p[0] == 'sampler2D'}
+        out = glsl.render(0, **kw)
+        assert out.shape == (64, 64, 4)
+        assert out.dtype == np.uint8
+    finally:
+        glsl.release()
+
+def test_grayscale_shader(gl_shader) -> None:
+    """color-grayscale.frag matches the same weighted sum on the CPU."""
+    source = (ROOT / 'res' / 'glsl' / 'color-grayscale.frag').read_text(encoding='utf-8')
+    glsl = gl_shader.GLSLShader(fragment=source, width=64, height=64, rgba8=True)
+    try:
+        frame = np.random.default_rng(1).integers(0, 256, (64, 64, 4), dtype=np.uint8)
+        frame[..., 3] = 255
+        out = glsl.render(0, image=frame)
+    finally:
+        glsl.release()
+    # the shader reads channels as stored, so the weights apply in array order
+    gray = frame[..., :3].astype(np.float64) @ np.array([0.299, 0.587, 0.114])
+    assert np.abs(out[..., 0].astype(np.float64) - gray).max() <= 1
+
+# =============================================================================
+
+@pytest.fixture
+def create_glsl(gl_shader, prompt_server):
+    pytest.importorskip("comfy.utils")
+    return pytest.importorskip("Jovimetrix.core.create_glsl")
+
+def test_node_batch(create_glsl, prompt_server) -> None:
+    """A shader node renders a timed batch and reports progress to the frontend."""
+    from Jovimetrix import Lexicon
+    fragment = """
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  fragColor = vec4(vec3(float(iFrame) / 255.0), 1.0);
+}
+"""
+    _, class_def = create_glsl.glsl_node("frame", "frame.frag", fragment, create_glsl.shader_meta(fragment))
+    image, rgb, mask = class_def().run("1", **{Lexicon.WH: (64, 64), Lexicon.BATCH: 4, Lexicon.FPS: 24})
+    assert tuple(image.shape) == (4, 64, 64, 4)
+    frames = np.round(rgb[:, 0, 0, 0].numpy() * 255).astype(int).tolist()
+    assert frames == [0, 1, 2, 3]
+    routes = [route for route, _ in prompt_server.sent]
+    assert "jovi-glsl-time" in routes
+
+@pytest.mark.parametrize("fname", SHADERS, ids=[f.name for f in SHADERS])
+def test_node_dynamic(create_glsl, fname) -> None:
+    """The node built for each bundled shader runs on an input image."""
+    import torch
+    from Jovimetrix import Lexicon
+    source = fname.read_text(encoding='utf-8')
+    meta = create_glsl.shader_meta(source)
+    if (ret := create_glsl.glsl_node(fname.stem, str(fname), source, meta)) is None:
+        pytest.skip("hidden shader")
+    node = ret[1]()
+    image = torch.rand((1, 64, 64, 4))
+    kw = {p[1]: image for p in node.PARAM if p[0] == 'sampler2D'}
+    out = node.run("2", **kw, **{Lexicon.WH: (64, 64)})
+    assert tuple(out[0].shape) == (1, 64, 64, 4)
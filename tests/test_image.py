@@ -0,0 +1,231 @@
+"""
+Jovimetrix - http://www.github.com/amorano/jovimetrix
+Image Support Tests
+"""
+
+import time
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+image = pytest.importorskip("Jovimetrix.sup.image")
+
+# =============================================================================
+
+@pytest.fixture
+def noise() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (96, 96, 3), dtype=np.uint8)
+
+@pytest.mark.parametrize("severity", [0.5, 1.0])
+@pytest.mark.parametrize("simulator", list(image.EnumCBSimulator))
+@pytest.mark.parametrize("deficiency", list(image.EnumCBDeficiency))
+def test_color_blind_lut(noise, deficiency, simulator, severity) -> None:
+    """The LUT lookup stays within a just noticeable difference of daltonlens."""
+    color = pytest.importorskip("skimage.color")
+    rgb = cv2.cvtColor(noise, cv2.COLOR_BGR2RGB)
+    direct = image.CB_SIMULATOR[simulator]().simulate_cvd(rgb, deficiency.value, severity=severity)
+    lut = image.image_color_blind(noise, deficiency, simulator, severity)
+    lut = cv2.cvtColor(lut, cv2.COLOR_BGR2RGB)
+    delta = color.deltaE_ciede2000(color.rgb2lab(direct), color.rgb2lab(lut))
+    assert delta.mean() < 0.5
+    assert delta.max() < 3
+
+def test_color_blind_error(record_property) -> None:
+    """Worst and mean CIEDE2000 of the LUT against the direct per-pixel
+    transform over every deficiency and simulator, and the time of each."""
+    color = pytest.importorskip("skimage.color")
+    frame = np.random.default_rng(44).integers(0, 256, (512, 512, 3), dtype=np.uint8)
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    worst = mean = 0.
+    direct_time = lut_time = 0.
+    for deficiency in image.EnumCBDeficiency:
+        for simulator in image.EnumCBSimulator:
+            start = time.perf_counter()
+            direct = image.CB_SIMULATOR[simulator]().simulate_cvd(rgb, deficiency.value, severity=1.0)
+            direct_time += time.perf_counter() - start
+            # the first call builds and caches the table
+            image.image_color_blind(frame, deficiency, simulator)
+            start = time.perf_counter()
+            lut = image.image_color_blind(frame, deficiency, simulator)
+            lut_time += time.perf_counter() - start
+            lut = cv2.cvtColor(lut, cv2.COLOR_BGR2RGB)
+            delta = color.deltaE_ciede2000(color.rgb2lab(direct), color.rgb2lab(lut))
+            worst = max(worst, float(delta.max()))
+            mean = max(mean, float(delta.mean()))
+
+    count = len(image.EnumCBDeficiency) * len(image.EnumCBSimulator)
+    record_property("delta_e_max", worst)
+    record_property("delta_e_mean", mean)
+    record_property("direct_ms", direct_time * 1000 / count)
+    record_property("lut_ms", lut_time * 1000 / count)
+    print(f"dE max {worst:.2f}, worst mean {mean:.3f}; 512x512 direct "
+          f"{direct_time * 1000 / count:.1f} ms, lut {lut_time * 1000 / count:.1f} ms")
+    assert worst < 3
+    assert mean < 0.25
+    assert lut_time < direct_time
+
+def image_filter_float(image:np.ndarray, start, end, fuzz, use_range:bool) -> np.ndarray:
+    """The mask of the float tensor image_filter that the cv2.inRange one replaced."""
+    torch = pytest.importorskip("torch")
+    image = torch.from_numpy(image[..., :3].astype(np.float32) / 255.0)
+    fuzz = torch.tensor(fuzz, dtype=torch.float64)
+    start = torch.tensor(start, dtype=torch.float64) / 255.
+    end = torch.tensor(end, dtype=torch.float64) / 255.
+    if not use_range:
+        end = start
+    start -= fuzz
+    end += fuzz
+    start = torch.clamp(start, 0.0, 1.0)
+    end = torch.clamp(end, 0.0, 1.0)
+    mask = ((image[..., 0] >= start[0]) & (image[..., 0] <= end[0]) &
+            (image[..., 1] >= start[1]) & (image[..., 1] <= end[1]) &
+            (image[..., 2] >= start[2]) & (image[..., 2] <= end[2]))
+    return mask.numpy().astype(np.uint8) * 255
+
+@pytest.mark.parametrize("use_range", [False, True])
+@pytest.mark.parametrize("start, end, fuzz", [
+    ((128, 128, 128), (128, 128, 128), (0.5, 0.5, 0.5)),
+    ((10, 200, 90), (60, 255, 140), (0.1, 0.05, 0.2)),
+    ((0, 0, 0), (255, 255, 255), (0, 0, 0)),
+    ((37, 141, 222), (90, 170, 250), (0.003, 0.0, 1 / 255.)),
+])
+def test_filter_mask(use_range, start, end, fuzz) -> None:
+    """The cv2.inRange mask equals the float mask it replaced, pixel for pixel."""
+    rng = np.random.default_rng(1)
+    frame = rng.integers(0, 256, (64, 64, 4), dtype=np.uint8)
+    # every value of every channel is tested
+    frame[:4, :, :3] = np.arange(256, dtype=np.uint8).reshape(4, 64, 1)
+    if not use_range:
+        frame[4:8, :8, :3] = start
+    expected = image_filter_float(frame, start, end, fuzz, use_range)
+    out, mask = image.image_filter(frame, start, end, fuzz, use_range)
+    assert np.array_equal(mask, expected)
+    assert np.array_equal(out[mask == 0], np.zeros_like(out[mask == 0]))
+    assert np.array_equal(out[mask > 0], frame[mask > 0])
+
+    batch = np.stack([frame, frame[::-1]])
+    _, masks = image.image_filter(batch, start, end, fuzz, use_range)
+    assert np.array_equal(masks[0], expected)
+    assert np.array_equal(masks[1], expected[::-1])
+
+def median3x3_loop(image:np.ndarray) -> np.ndarray:
+    """The per-pixel sorted() MEDIAN3x3 the rank filter replaced."""
+    height, width = image.shape[:2]
+    out = np.zeros([height, width])
+    for i in range(1, height-1):
+        for j in range(1, width-1):
+            out[i, j] = sorted(image[i-1:i+2, j-1:j+2].ravel())[4]
+    return out
+
+def test_median3x3(noise) -> None:
+    """MEDIAN3x3 matches the old loop, interior and zeroed border alike."""
+    grey = noise[..., 0]
+    assert np.array_equal(image.MEDIAN3x3(grey), median3x3_loop(grey))
+
+@pytest.mark.parametrize("size", [3, 5, 9])
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_rank_filter_median(noise, size, dtype) -> None:
+    """Rank 0.5 is the median of every channel's window; alpha passes through."""
+    ndimage = pytest.importorskip("scipy.ndimage")
+    frame = np.dstack([noise, noise[..., 0]]).astype(dtype)
+    half = size // 2
+    interior = (slice(half, -half), slice(half, -half))
+    expected = ndimage.median_filter(frame[..., :3], size=(size, size, 1), mode='nearest')
+    out = image.image_rank_filter(frame, size, 0.5)
+    assert out.dtype == frame.dtype
+    assert np.array_equal(out[..., :3][interior], expected[interior])
+    assert np.array_equal(out[..., 3], frame[..., 3])
+
+    batch = image.image_rank_filter(np.stack([frame, frame]), size, 0.5)
+    assert np.array_equal(batch[1], out)
+
+@pytest.mark.parametrize("rank", [0, 1])
+def test_rank_filter_minmax(noise, rank) -> None:
+    ndimage = pytest.importorskip("scipy.ndimage")
+    func = ndimage.minimum_filter if rank == 0 else ndimage.maximum_filter
+    expected = func(noise, size=(5, 5, 1), mode='nearest')
+    assert np.array_equal(image.image_rank_filter(noise, 5, rank), expected)
+
+def test_blend_cpu_skips_alpha_scan(noise, monkeypatch) -> None:
+    """With GL acceleration off, blending never scans the layers' alpha."""
+    def scan(_) -> bool:
+        raise AssertionError("alpha scanned on the CPU path")
+    monkeypatch.setattr(image, "JOV_GLSL_ACCEL", False)
+    monkeypatch.setattr(image, "image_opaque", scan)
+    out = image.image_blend(noise, noise[::-1], alpha=0.5)
+    assert out.shape[:2] == noise.shape[:2]
+
+def stereo_inputs() -> tuple:
+    rng = np.random.default_rng(41)
+    h, w = 24, 256
+    frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    ramp = np.tile(np.linspace(0, 255, w), (h, 1))
+    depth = np.clip(ramp + rng.normal(0, 20, (h, w)), 0, 255).astype(np.uint8)
+    depth[6:18, 80:180] = 250
+    return frame, depth
+
+def test_stereo_reference() -> None:
+    """The compiled stereogram and stereo shift kernels reproduce, bit for
+    bit, what the per-pixel Python loops produced (tests/data/stereo.npz,
+    saved from the loops with these inputs and noise seed 0)."""
+    pytest.importorskip("numba")
+    reference = np.load(Path(__file__).parent / 'data' / 'stereo.npz')
+    frame, depth = stereo_inputs()
+    for key, shift in [('stereogram', 1.), ('stereogram_back', -1.5)]:
+        np.random.seed(0)
+        out = image.image_stereogram(frame, depth, divisions=4, shift=shift)
+        assert np.array_equal(out, reference[key]), key
+
+    rgba = np.dstack([frame, np.full(depth.shape, 255, np.uint8)])
+    assert np.array_equal(image.image_stereo_shift(rgba, depth, 10), reference['shift'])
+    assert np.array_equal(image.image_stereo_shift(frame, depth, -6), reference['shift_back'])
+
+def ssim_inputs() -> tuple:
+    rng = np.random.default_rng(45)
+    a = cv2.GaussianBlur(rng.integers(0, 256, (300, 420), dtype=np.uint8), (0, 0), 2)
+    b = np.clip(a + rng.normal(0, 12, a.shape), 0, 255).astype(np.uint8)
+    # a block left identical, so small tiles take the skip path
+    b[100:200, 50:150] = a[100:200, 50:150]
+    return a, b
+
+@pytest.mark.parametrize("tile", [512, 64])
+@pytest.mark.parametrize("gaussian", [False, True])
+def test_ssim_skimage(gaussian, tile) -> None:
+    """image_ssim agrees with skimage's structural_similarity for the box and
+    gaussian windows, uint8 and float, tiled or not."""
+    metrics = pytest.importorskip("skimage.metrics")
+    kw = {'gaussian_weights': True, 'sigma': 1.5} if gaussian else {}
+    # the float32 filters cost a little precision in the gaussian weights
+    tol = 5e-6 if gaussian else 1e-6
+    a, b = ssim_inputs()
+    score, full = image.image_ssim(a, b, gaussian=gaussian, tile=tile)
+    expected, expected_full = metrics.structural_similarity(a, b, data_range=255, full=True, **kw)
+    assert abs(score - expected) < tol
+    assert np.abs(full - expected_full).max() < 1e-3
+
+    a = a.astype(np.float32) / 255.
+    b = b.astype(np.float32) / 255.
+    score, _ = image.image_ssim(a, b, gaussian=gaussian, tile=tile)
+    data_range = float(max(a.max(), b.max()) - min(a.min(), b.min()))
+    expected = metrics.structural_similarity(a, b, data_range=data_range, **kw)
+    assert abs(score - expected) < tol * 10
+
+@pytest.mark.parametrize("gaussian", [False, True])
+def test_ssim_speed(gaussian, record_property) -> None:
+    """Time image_ssim against skimage on a 2048x2048 pair."""
+    metrics = pytest.importorskip("skimage.metrics")
+    kw = {'gaussian_weights': True, 'sigma': 1.5} if gaussian else {}
+    a = np.random.default_rng(46).integers(0, 256, (2048, 2048), dtype=np.uint8)
+    b = a.copy()
+    b[::7] = 0
+    start = time.perf_counter()
+    image.image_ssim(a, b, gaussian=gaussian)
+    ours = time.perf_counter() - start
+    start = time.perf_counter()
+    metrics.structural_similarity(a, b, data_range=255, **kw)
+    theirs = time.perf_counter() - start
+    record_property("image_ssim_ms", ours * 1000)
+    record_property("skimage_ms", theirs * 1000)
+    print(f"2048x2048 {'gaussian' if gaussian else 'box'}: image_ssim {ours * 1000:.0f} ms, skimage {theirs * 1000:.0f} ms")
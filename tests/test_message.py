@@ -0,0 +1,73 @@
+"""
+Jovimetrix - http://www.github.com/amorano/jovimetrix
+Frontend Message Tests
+"""
+
+import time
+
+import pytest
+
+jovi = pytest.importorskip("Jovimetrix")
+
+# =============================================================================
+
+def throttle(rate:float) -> "jovi.ComfyMessageThrottle":
+    """A private throttle, not the process-wide singleton."""
+    return type.__call__(jovi.ComfyMessageThrottle, rate=rate)
+
+def test_burst(prompt_server) -> None:
+    """A burst for one node and route goes out as its first and last message."""
+    messages = throttle(10.)
+    for idx in range(1000):
+        messages.send("7", "jovi-glsl-time", {"id": "7", "t": idx})
+    assert len(prompt_server.sent) == 1
+    messages.flush("7", "jovi-glsl-time")
+    assert [data["t"] for _, data in prompt_server.sent] == [0, 999]
+    assert messages.stats == {'sent': 2, 'coalesced': 998}
+
+def test_keys(prompt_server) -> None:
+    """Nodes and routes are throttled apart; flush() only sends its own."""
+    messages = throttle(10.)
+    for idx in range(100):
+        for ident in ("1", "2"):
+            messages.send(ident, "jovi-glsl-time", {"id": ident, "t": idx})
+        messages.send("1", "jovi-other", {"id": "1", "t": idx})
+    assert len(prompt_server.sent) == 3
+    messages.flush("1", "jovi-glsl-time")
+    assert prompt_server.sent[-1] == ("jovi-glsl-time", {"id": "1", "t": 99})
+    messages.flush()
+    assert len(prompt_server.sent) == 6
+    assert messages.stats == {'sent': 6, 'coalesced': 3 * 98}
+
+def test_window(prompt_server) -> None:
+    """Without a flush, the latest payload goes out when the window closes."""
+    messages = throttle(0.05)
+    for idx in range(50):
+        messages.send("3", "jovi-glsl-time", {"id": "3", "t": idx})
+    deadline = time.monotonic() + 2
+    while len(prompt_server.sent) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [data["t"] for _, data in prompt_server.sent] == [0, 49]
+
+    # a message after the window goes straight out
+    time.sleep(0.06)
+    messages.send("3", "jovi-glsl-time", {"id": "3", "t": 50})
+    assert prompt_server.sent[-1][1]["t"] == 50
+
+def test_comfy_message(prompt_server) -> None:
+    """comfy_message(throttle=True) goes through the shared throttle; a batch
+    of 1000 frames sends 2 messages and counts 998 saved."""
+    shared = jovi.ComfyMessageThrottle()
+    rate = shared.rate
+    shared.rate = 10.
+    try:
+        before = shared.stats
+        for idx in range(1000):
+            jovi.comfy_message("9", "jovi-glsl-time", {"t": idx}, throttle=True)
+        shared.flush("9", "jovi-glsl-time")
+        after = shared.stats
+    finally:
+        shared.rate = rate
+    assert after['sent'] - before['sent'] == 2
+    assert after['coalesced'] - before['coalesced'] == 998
+    assert prompt_server.sent[-1] == ("jovi-glsl-time", {"t": 999, "id": "9"})
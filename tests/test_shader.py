@@ -0,0 +1,337 @@
+"""
+Jovimetrix - http://www.github.com/amorano/jovimetrix
+GLSL Support Tests
+"""
+
+import threading
+from typing import List
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("OpenGL")
+shader = pytest.importorskip("Jovimetrix.sup.shader")
+
+# =============================================================================
+
+PASSTHROUGH = """
+uniform sampler2D image;
+
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  fragColor = texture(image, fragCoord / iResolution.xy);
+}
+"""
+
+@pytest.fixture
+def glsl(gl_shader) -> "shader.GLSLShader":
+    glsl = shader.GLSLShader(fragment=PASSTHROUGH, width=64, height=64, rgba8=True)
+    yield glsl
+    glsl.release()
+
+def test_resize_keeps_program(glsl) -> None:
+    """Alternating render sizes picks pooled targets and never recompiles."""
+    frame = np.zeros((64, 64, 4), dtype=np.uint8)
+    frame[..., 2] = 200
+    frame[..., 3] = 255
+    glsl.render(0, image=frame)
+    compiled = shader.GLSLProgramCache().stats['compile']
+    for size in [(96, 64), (64, 64), (128, 80), (96, 64), (64, 64)]:
+        glsl.size = size
+        out = glsl.render(0, image=frame)
+        assert out.shape == (size[1], size[0], 4)
+        assert np.array_equal(out[0, 0], frame[0, 0])
+    assert shader.GLSLProgramCache().stats['compile'] == compiled
+
+COLOR = """
+uniform vec4 color;
+
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  fragColor = color;
+}
+"""
+
+def test_shared_context(gl_shader) -> None:
+    """Shaders share one context, so alternating between them never switches."""
+    shaders = [shader.GLSLShader(fragment=COLOR, width=64, height=64, rgba8=True) for _ in range(3)]
+    try:
+        for glsl in shaders:
+            glsl.render(0, color=(0, 0, 0, 1))
+        switches = shader.GLWorker().stats['switches']
+        for idx in range(12):
+            value = idx / 11.
+            out = shaders[idx % 3].render(0, color=(value, 0, 0, 1))
+            assert abs(int(out[0, 0, 0]) - round(value * 255)) <= 1
+        assert shader.GLWorker().stats['switches'] == switches
+    finally:
+        for glsl in shaders:
+            glsl.release()
+
+def test_threads(gl_shader) -> None:
+    """Six threads with a shader each render at once; every frame is theirs."""
+    count = 6
+    frames = 20
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def work(idx:int) -> None:
+        glsl = shader.GLSLShader(fragment=COLOR, width=64, height=64, rgba8=True)
+        try:
+            barrier.wait()
+            for frame in range(frames):
+                size = (64 + 16 * (frame % 3), 64 + 8 * idx)
+                glsl.size = size
+                color = [idx * 40 / 255., frame * 10 / 255., 0.5, 1.]
+                if frame % 2:
+                    out = glsl.submit(0, color=color).result()
+                else:
+                    out = glsl.render(0, color=color)
+                assert out.shape == (size[1], size[0], 4)
+                assert abs(int(out[5, 5, 0]) - idx * 40) <= 1, (idx, frame)
+                assert abs(int(out[5, 5, 1]) - frame * 10) <= 1, (idx, frame)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            glsl.release()
+
+    threads = [threading.Thread(target=work, args=(idx,)) for idx in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+    stats = shader.GLWorker().stats
+    assert stats['peak'] >= 1
+    assert stats['depth'] == 0
+
+class UniformCalls:
+    """Stands in for OpenGL.GL and records every glUniform* call."""
+    def __init__(self) -> None:
+        self.calls = []
+
+    def __getattr__(self, name:str):
+        if not name.startswith('glUniform'):
+            raise AttributeError(name)
+        return lambda loc, *data: self.calls.append((loc, data))
+
+def test_uniform_setter(monkeypatch) -> None:
+    """Values edited in place are sent again; unchanged ones are not."""
+    fake = UniformCalls()
+    monkeypatch.setattr(shader, "gl", fake)
+    state = {}
+    setter = shader.uniform_setter('vec4', 3, state)
+
+    color = [1., 0., 0., 1.]
+    setter(color)
+    setter(color)
+    assert fake.calls == [(3, (1., 0., 0., 1.))]
+    color[0] = 0.
+    color[1] = 1.
+    setter(color)
+    assert fake.calls[-1] == (3, (0., 1., 0., 1.))
+
+    array = np.array([0.25, 0.5, 0.75, 1.], dtype=np.float32)
+    setter(array)
+    array[0] = 1.
+    setter(array)
+    assert fake.calls[-1][1][0] == 1.
+    count = len(fake.calls)
+
+    # an equal value is not sent again, whatever object carries it
+    setter([1., 0.5, 0.75, 1.])
+    setter((1., 0.5, 0.75, 1.))
+    assert len(fake.calls) == count
+
+    setter(None)
+    assert fake.calls[-1] == (3, (0, 0, 0, 0))
+
+    scalar = shader.uniform_setter('int', 4, state)
+    scalar(2)
+    scalar(2)
+    scalar("2")
+    scalar(3)
+    assert [c for c in fake.calls if c[0] == 4] == [(4, (2,)), (4, (3,))]
+
+def test_uniform_in_place(gl_shader) -> None:
+    """Editing a colour list in place between renders changes the output."""
+    glsl = shader.GLSLShader(fragment=COLOR, width=64, height=64, rgba8=True)
+    try:
+        color = [1., 0., 0., 1.]
+        assert tuple(glsl.render(0, color=color)[0, 0, :3]) == (255, 0, 0)
+        color[0], color[2] = 0., 1.
+        assert tuple(glsl.render(0, color=color)[0, 0, :3]) == (0, 0, 255)
+        array = np.array([0., 1., 0., 1.])
+        assert tuple(glsl.render(0, color=array)[0, 0, :3]) == (0, 255, 0)
+        array[0] = 1.
+        assert tuple(glsl.render(0, color=array)[0, 0, :3]) == (255, 255, 0)
+    finally:
+        glsl.release()
+
+UNIFORMS = [('float', f'f{i}', 0.5) for i in range(8)] + \
+    [('vec2', f'v{i}', (0.5, 0.25)) for i in range(4)] + \
+    [('vec3', f'w{i}', (0.5, 0.25, 0.125)) for i in range(4)] + \
+    [('vec4', f'x{i}', (0.5, 0.25, 0.125, 1.)) for i in range(4)] + \
+    [('int', f'i{i}', 2) for i in range(2)] + \
+    [('ivec2', f'j{i}', (1, 2)) for i in range(2)]
+
+def test_uniform_overhead(gl_shader, monkeypatch, record_property) -> None:
+    """CPU cost per frame of 24 uniforms: bound setters against the old
+    parse_value and glUniform* dispatch."""
+    import time
+    frames = 2000
+    values = {name: val for _, name, val in UNIFORMS}
+
+    def frame_old(calls:UniformCalls) -> None:
+        for loc, (typ, name, _) in enumerate(UNIFORMS):
+            data = shader.parse_value(values[name], shader.PTYPE[typ], 0)
+            data = data if isinstance(data, (list, tuple)) else [data]
+            getattr(calls, shader.LAMBDA_UNIFORM[typ])(loc, *data)
+
+    def timed(func) -> float:
+        start = time.perf_counter()
+        for _ in range(frames):
+            func()
+        return (time.perf_counter() - start) / frames * 1e6
+
+    calls = UniformCalls()
+    monkeypatch.setattr(shader, "gl", calls)
+    old = timed(lambda: frame_old(calls))
+    state = {}
+    setters = [(shader.uniform_setter(typ, loc, state), name) for loc, (typ, name, _) in enumerate(UNIFORMS)]
+    calls.calls = []
+    steady = timed(lambda: [setter(values[name]) for setter, name in setters])
+    assert len(calls.calls) == len(UNIFORMS)
+    lists = {name: list(val) if isinstance(val, tuple) else val for name, val in values.items()}
+    edited = timed(lambda: [setter(lists[name]) for setter, name in setters])
+    monkeypatch.undo()
+
+    for key, val in [('parse_value_us', old), ('setter_us', steady), ('setter_list_us', edited)]:
+        record_property(key, val)
+        print(f"{key}: {val:.1f} us/frame")
+    assert steady < old
+
+    # and the same uniforms through a real program, values held constant
+    decl = "\n".join(f"uniform {typ} {name};" for typ, name, _ in UNIFORMS)
+    body = " + ".join(f"float({name}{'' if typ in ('float', 'int') else '.x'})" for typ, name, _ in UNIFORMS)
+    fragment = f"""
+{decl}
+
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {{
+  fragColor = vec4(vec3(({body}) / 64.0), 1.0);
+}}
+"""
+    glsl = shader.GLSLShader(fragment=fragment, width=64, height=64, rgba8=True)
+    try:
+        count = 100
+        start = time.perf_counter()
+        out = glsl.render_batch([0.] * count, [values])
+        record_property("render_batch_ms", (time.perf_counter() - start) / count * 1e3)
+        expected = sum(v if isinstance(v, (int, float)) else v[0] for v in values.values()) / 64.
+        assert abs(int(out[-1, 0, 0, 0]) - round(expected * 255)) <= 1
+    finally:
+        glsl.release()
+
+def frames_rgba(count:int, seed:int) -> List[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    ret = []
+    for _ in range(count):
+        frame = rng.integers(0, 256, (64, 64, 4), dtype=np.uint8)
+        frame[..., 3] = 255
+        ret.append(frame)
+    return ret
+
+TWO_PASS = """
+uniform sampler2D image;
+uniform sampler2D invert;
+
+// pass: invert
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  vec4 color = texelFetch(image, ivec2(fragCoord), 0);
+  fragColor = vec4(1.0 - color.rgb, 1.0);
+}
+
+// pass: out
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  vec4 color = texelFetch(invert, ivec2(fragCoord), 0);
+  fragColor = vec4(color.rgb * 0.5 + 0.25, 1.0);
+}
+"""
+
+def test_two_pass(gl_shader) -> None:
+    """The second pass reads the first pass of the same frame."""
+    glsl = shader.GLSLShader(fragment=TWO_PASS, width=64, height=64)
+    try:
+        frames = frames_rgba(3, 2)
+        out = glsl.render_batch([0.] * 3, [{'image': f} for f in frames])
+    finally:
+        glsl.release()
+    for idx, frame in enumerate(frames):
+        color = frame[..., :3] / 255.
+        expected = np.round(((1. - color) * 0.5 + 0.25) * 255)
+        # GL rows go bottom-up, the readback is flipped back
+        assert np.abs(out[idx, ..., :3] - expected).max() <= 1, idx
+
+FEEDBACK = """
+uniform sampler2D image;
+
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  vec4 prev = texelFetch(iPrevFrame, ivec2(fragCoord), 0);
+  vec4 color = texelFetch(image, ivec2(fragCoord), 0);
+  fragColor = vec4(mix(prev.rgb, color.rgb, 0.25), 1.0);
+}
+"""
+
+def test_prev_frame(gl_shader) -> None:
+    """iPrevFrame carries the last output across the frames of a batch and
+    starts from transparent black."""
+    glsl = shader.GLSLShader(fragment=FEEDBACK, width=64, height=64)
+    try:
+        frames = frames_rgba(6, 3)
+        out = glsl.render_batch([0.] * 6, [{'image': f} for f in frames])
+        # and on into the next call
+        more = glsl.render(0, image=frames[0])
+    finally:
+        glsl.release()
+    acc = np.zeros((64, 64, 3))
+    for idx, frame in enumerate(frames):
+        acc = acc * 0.75 + frame[..., :3] / 255. * 0.25
+        assert np.abs(out[idx, ..., :3] - np.round(acc * 255)).max() <= 1, idx
+    acc = acc * 0.75 + frames[0][..., :3] / 255. * 0.25
+    assert np.abs(more[..., :3] - np.round(acc * 255)).max() <= 1
+
+ACCUMULATE = """
+uniform sampler2D image;
+uniform sampler2D acc;
+
+// pass: acc
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  vec4 prev = texelFetch(acc, ivec2(fragCoord), 0);
+  vec4 color = texelFetch(image, ivec2(fragCoord), 0);
+  fragColor = vec4(prev.rgb + color.rgb / 8.0, 1.0);
+}
+
+// pass: out
+void mainImage( out vec4 fragColor, vec2 fragCoord ) {
+  vec4 sum = texelFetch(acc, ivec2(fragCoord), 0);
+  vec4 prev = texelFetch(iPrevFrame, ivec2(fragCoord), 0);
+  fragColor = vec4(sum.rg, prev.r, 1.0);
+}
+"""
+
+def test_pass_feedback(gl_shader) -> None:
+    """A pass reading itself gets its previous frame; iPrevFrame is the final
+    pass of the previous frame."""
+    glsl = shader.GLSLShader(fragment=ACCUMULATE, width=64, height=64)
+    try:
+        frames = frames_rgba(5, 4)
+        out = glsl.render_batch([0.] * 5, [{'image': f} for f in frames])
+    finally:
+        glsl.release()
+    acc = np.zeros((64, 64, 3))
+    last = np.zeros((64, 64, 3))
+    for idx, frame in enumerate(frames):
+        acc = acc + frame[..., :3] / 255. / 8.
+        expected = np.dstack([acc[..., 0], acc[..., 1], last[..., 0]])
+        expected = np.round(np.clip(expected, 0, 1) * 255)
+        assert np.abs(out[idx, ..., :3] - expected).max() <= 1, idx
+        last = expected / 255.